@@ -0,0 +1,22 @@
+#!/usr/bin/env python3
+"""
+Ahead-of-time build of the YOLO preprocess kernel
+Produces cam_kernels.*.so next to live_cam.py so the server skips Numba JIT warmup.
+
+Usage (on the Pi, re-run after editing preprocess_kernel.py):
+  python3 build_kernels.py
+"""
+import os
+from numba.pycc import CC
+from preprocess_kernel import preprocess_chw
+
+# C-contiguous letterboxed YOLO frame in, C-contiguous (3, H, W) float32 tensor out
+SIGNATURE = 'void(u1[:,:,::1], f4[::1], f4[::1], f4[::1], f4[::1], f4[:,:,::1])'
+
+cc = CC('cam_kernels')
+cc.output_dir = os.path.dirname(os.path.abspath(__file__))
+cc.export('preprocess_chw', SIGNATURE)(preprocess_chw)
+
+if __name__ == "__main__":
+    cc.compile()
+    print(f"✅ Built cam_kernels in {cc.output_dir}")
@@ -1,13 +1,18 @@
 from flask import Flask, Response, request, jsonify
-from picamera2 import Picamera2
-import io
+from picamera2 import Picamera2, MappedArray
 import atexit
 import numpy as np
-from PIL import Image, ImageOps
+import numba as nb
+from PIL import Image
+import cv2
+from turbojpeg import TurboJPEG, TJPF_RGB, TJSAMP_420
 import os
 from datetime import datetime
 import threading
 import time
+import struct
+from functools import lru_cache
+from preprocess_kernel import preprocess_chw
 
 app = Flask(__name__)
 
@@ -36,6 +41,12 @@ class Config:
     # YOLO inference size - 640x640 is standard, but consider 1280 for small logos
     # For logo detection, larger inference size significantly improves small object detection
     YOLO_SIZE = (640, 640)      # Standard (use 1280,1280 if GPU allows)
+    YOLO_BATCH_MAX = 4          # Max frames per /frame/yolo/batch response
+
+    # ISP-scaled preview stream used for YOLO preprocessing
+    # Keep SENSOR_SIZE's aspect ratio so letterboxing only has to pad,
+    # and keep widths a multiple of 64 so YUV420 rows are unpadded
+    LORES_SIZE = (640, 360)     # 1920x1080 scaled to fit YOLO_SIZE
 
     # ==========================================================================
     # FRAME RATE - Lower for better image quality
@@ -48,6 +59,7 @@ class Config:
     # QUALITY SETTINGS - Maximum quality for logo detail preservation
     # ==========================================================================
     JPEG_QUALITY = 95           # High quality - logos need sharp edges
+    STREAM_JPEG_QUALITY = 60    # Browser preview (MJPEG) only
     SAVE_FOLDER = "/home/ali/captured_images"
 
     # ==========================================================================
@@ -90,6 +102,19 @@ class Config:
     # 0=off, 1=fast, 2=high quality
     # Logos need clean edges - noise reduction helps
     NOISE_REDUCTION_MODE = 2    # High quality denoising
+
+    # FAST MODE: favour latency and CMA memory over ISP quality on the Pi
+    # Turns ISP denoise off (overrides NOISE_REDUCTION_MODE) and uses 2
+    # camera buffers instead of 4
+    FAST_MODE = True
+
+    # THREAD PINNING: capture gets a core of its own (Pi 5 has 4) at SCHED_FIFO
+    # (needs root or CAP_SYS_NICE). Preprocess is kept off that core but not
+    # narrowed to one core or made real-time: Numba's prange workers are
+    # created from it and inherit its CPU mask and scheduling policy
+    CAPTURE_CORE = 3
+    PREPROCESS_CORES = {0, 1, 2}
+    THREAD_RT_PRIORITY = 10     # Capture SCHED_FIFO priority, None to keep SCHED_OTHER
     
     # AUTOFOCUS: Enable for sharp logo capture
     # AfMode: 0=Manual, 1=Auto (single shot), 2=Continuous
@@ -114,35 +139,144 @@ class Config:
     
 config = Config()
 
+# Preview stream: no Huffman optimization or progressive pass, just fast baseline JPEG
+_STREAM_JPEG_PARAMS = [
+    cv2.IMWRITE_JPEG_QUALITY, config.STREAM_JPEG_QUALITY,
+    cv2.IMWRITE_JPEG_OPTIMIZE, 0,
+    cv2.IMWRITE_JPEG_PROGRESSIVE, 0,
+]
+
 # --- Create folder for saved images ---
 os.makedirs(config.SAVE_FOLDER, exist_ok=True)
 
+@lru_cache(maxsize=None)
+def _npy_header(shape: tuple, descr: str) -> bytes:
+    """NPY v1.0 header for a C-contiguous array, built once per shape/dtype"""
+    header = "{'descr': %r, 'fortran_order': False, 'shape': %r, }" % (descr, shape)
+    # Space-pad so magic (6) + version (2) + length (2) + header + newline is 64-aligned
+    padding = -(10 + len(header) + 1) % 64
+    header = header + " " * padding + "\n"
+    return b"\x93NUMPY\x01\x00" + struct.pack("<H", len(header)) + header.encode("latin1")
+
+def _quantize(tensor: np.ndarray, dtype: str) -> tuple[np.ndarray, float]:
+    """
+    Convert a float32 tensor for transport: "fp32" (as-is), "fp16" or "int8"
+
+    int8 uses one symmetric per-tensor scale (zero point 0); dequantize
+    with q / scale. The returned scale is 1.0 for the float formats.
+    """
+    if dtype == "fp32":
+        return tensor, 1.0
+    if dtype == "fp16":
+        return tensor.astype(np.float16), 1.0
+    if dtype == "int8":
+        peak = float(np.max(np.abs(tensor)))
+        scale = 127.0 / peak if peak > 0 else 1.0
+        quantized = np.rint(tensor * scale)
+        np.clip(quantized, -128, 127, out=quantized)
+        return quantized.astype(np.int8), scale
+    raise ValueError(f"Unsupported dtype: {dtype}")
+
+# =============================================================================
+# PREPROCESS KERNEL - stretch + normalize + HWC->CHW in one pass
+# =============================================================================
+try:
+    # AOT build from build_kernels.py: no JIT warmup, single-threaded
+    from cam_kernels import preprocess_chw as _preprocess
+except ImportError:
+    _preprocess = nb.njit(parallel=True, fastmath=True, cache=True)(preprocess_chw)
+
 # =============================================================================
 # CAMERA CLASS - Well-structured for YOLO integration
 # =============================================================================
 class CameraStream:
     def __init__(self):
         self.picam2 = Picamera2()
-        self.frame = None
+        # Ping-pong YUV420 buffers per stream: the capture thread fills the back
+        # slot while readers use the front one. Readers take no lock (seqlock):
+        # they snapshot _front, read, then check _writing to see whether the
+        # capture thread has started recycling their slot meanwhile
+        self._buffers = {
+            stream: [np.empty((h * 3 // 2, w), dtype=np.uint8) for _ in range(2)]
+            for stream, (w, h) in (("main", config.SENSOR_SIZE), ("lores", config.LORES_SIZE))
+        }
+        self._front = (0, 0)                # (frame id, buffer index); one atomic swap
+        self._writing = 0                   # Id of the frame being copied in, if any
+        self.frame_available = False
         self.frame_lock = threading.Lock()
+        # Signalled by the capture thread after each published frame; only
+        # used for wake-ups, never held while reading pixels
+        self._frame_cond = threading.Condition(self.frame_lock)
+        self._frames_captured = 0           # Doubles as the frame id (see frame_id)
         self.running = False
+
+        # Latest-only outputs of the preprocess thread; each slot has its own
+        # lock and is simply overwritten, so slow consumers never queue frames
+        self._yolo_slot = (None, None)      # (stretched letterboxed frame, meta)
+        self._yolo_lock = threading.RLock()
+        self._jpeg_slot = None              # MJPEG preview JPEG of the main stream
+        self._jpeg_lock = threading.Lock()
+        # Wakes MJPEG generators when a new preview JPEG lands; a Condition
+        # rather than an Event so every viewer sees every frame
+        self._jpeg_cond = threading.Condition(self._jpeg_lock)
+        # Ping-pong CHW outputs of the fused preprocess kernel (see get_yolo_tensor)
+        yolo_w, yolo_h = config.YOLO_SIZE
+        tensor_shape = (3, yolo_h, yolo_w)
+        self._yolo_buffers = [np.empty((yolo_h, yolo_w, 3), dtype=np.uint8) for _ in range(2)]
+        self._tensor_buffers = [np.empty(tensor_shape, dtype=np.float32) for _ in range(2)]
+        self._tensor_slot = (None, None)    # (front tensor buffer, meta)
+        self.tensor_lock = threading.RLock()
+        # Batched tensors: the preprocess thread fills rows of one NCHW buffer
+        # while the other belongs to the last get_yolo_batch caller
+        batch_shape = (config.YOLO_BATCH_MAX,) + tensor_shape
+        self._batch_buffers = [np.empty(batch_shape, dtype=np.float32) for _ in range(2)]
+        self._batch_fill = 0                # Index of the buffer being filled
+        self._pending = []                  # Metas of the rows filled so far
+        self._batch_cond = threading.Condition()
+        self.batch_lock = threading.RLock()
+
+        # Preprocess constants and scratch buffers, allocated once; only the
+        # preprocess thread touches the scratch buffers
+        self._mean = np.array(config.NORMALIZE_MEAN, dtype=np.float32)
+        self._inv_std = (1.0 / np.array(config.NORMALIZE_STD, dtype=np.float32)).astype(np.float32)
+        self._levels = np.arange(256, dtype=np.float32)
+        self._main_bgr = np.empty((config.SENSOR_SIZE[1], config.SENSOR_SIZE[0], 3), dtype=np.uint8)
+        self._lores_rgb = np.empty((config.LORES_SIZE[1], config.LORES_SIZE[0], 3), dtype=np.uint8)
+        # Letterbox geometry is fixed by LORES_SIZE/YOLO_SIZE: the black bars are
+        # drawn once and each frame only fills the image region (a view)
+        self._letterboxed = np.zeros((yolo_h, yolo_w, 3), dtype=np.uint8)
+        self._letterbox_roi, self._letterbox_meta = self._letterbox_layout(
+            config.LORES_SIZE, config.YOLO_SIZE, self._letterboxed)
+        self.noise_reduction_mode = 0 if config.FAST_MODE else config.NOISE_REDUCTION_MODE
+        self._tj = TurboJPEG()  # libjpeg-turbo SIMD encoder, shared by all JPEG paths
+        # Per-frame artifacts built on demand (RGB conversions, JPEG encodes),
+        # key -> (frame_id, value); a hit skips the work for the same capture
+        self._frame_cache = {}
+        self._cache_lock = threading.Lock()
         self._configure_camera()
         
     def _configure_camera(self):
         """Configure camera with YOLO-optimized settings"""
-        # Capture full sensor FOV, then letterbox for YOLO in software
+        # Capture full sensor FOV; the ISP also scales it down to the lores
+        # stream, which is letterboxed for YOLO in software.
+        # YUV420 is 1.5 bytes/pixel (half of BGR888) and is converted to RGB
+        # only where an RGB image is actually needed
         cam_config = self.picam2.create_video_configuration(
             main={
                 "size": config.SENSOR_SIZE,
-                "format": "BGR888"  # BGR888 gives correct colors on this camera
+                "format": "YUV420"
+            },
+            lores={
+                "size": config.LORES_SIZE,
+                "format": "YUV420"
             },
             controls={
                 "FrameRate": config.FRAME_RATE,
                 "AeEnable": config.USE_MANUAL_TUNING is False,
                 "AwbEnable": config.USE_MANUAL_TUNING is False,
-                "NoiseReductionMode": config.NOISE_REDUCTION_MODE,
+                "NoiseReductionMode": self.noise_reduction_mode,
             },
-            buffer_count=4  # Buffer for smooth streaming
+            buffer_count=2 if config.FAST_MODE else 4  # Fewer buffers = less CMA
         )
         self.picam2.configure(cam_config)
 
@@ -152,7 +286,7 @@ class CameraStream:
             "Sharpness": config.ISP_SHARPNESS,
             "Contrast": config.ISP_CONTRAST,
             "Saturation": config.ISP_SATURATION,
-            "NoiseReductionMode": config.NOISE_REDUCTION_MODE,
+            "NoiseReductionMode": self.noise_reduction_mode,
         }
         
         # Add autofocus if enabled
@@ -180,119 +314,350 @@ class CameraStream:
             print(f"Control warning: {exc}")
         
     def start(self):
-        """Start camera and frame capture thread"""
+        """Start camera, frame capture thread and preprocess thread"""
         self.picam2.start()
         self._apply_runtime_controls()
         self.running = True
-        self.capture_thread = threading.Thread(target=self._capture_loop, daemon=True)
+        self.capture_thread = threading.Thread(target=self._capture_loop, name="capture", daemon=True)
         self.capture_thread.start()
+        self.preprocess_thread = threading.Thread(target=self._preprocess_loop, name="preprocess", daemon=True)
+        self.preprocess_thread.start()
+        self._pin_thread(self.capture_thread, {config.CAPTURE_CORE}, config.THREAD_RT_PRIORITY)
+        self._pin_thread(self.preprocess_thread, config.PREPROCESS_CORES)
         print(f"✅ Camera started at {config.SENSOR_SIZE[0]}x{config.SENSOR_SIZE[1]}")
         
+    @staticmethod
+    def _pin_thread(thread, cores, rt_priority=None):
+        """Restrict a started thread to cores, optionally at SCHED_FIFO rt_priority (best effort)"""
+        tid = thread.native_id
+        try:
+            cores = set(cores) & os.sched_getaffinity(0)
+            if cores:
+                os.sched_setaffinity(tid, cores)
+        except OSError as exc:
+            print(f"Affinity warning ({thread.name}): {exc}")
+        if rt_priority is None:
+            return
+        try:
+            os.sched_setscheduler(tid, os.SCHED_FIFO, os.sched_param(rt_priority))
+        except PermissionError:
+            print(f"SCHED_FIFO needs root or CAP_SYS_NICE; {thread.name} keeps default priority")
+        except OSError as exc:
+            print(f"Scheduler warning ({thread.name}): {exc}")
+
     def _capture_loop(self):
         """Continuous frame capture for low latency"""
         while self.running:
             try:
-                frame = self.picam2.capture_array()
-                
-                # Frame is already in correct RGB format from BGR888 config
+                frame_id = self._frames_captured + 1
+                write_idx = 1 - self._front[1]
+                request = self.picam2.capture_request()
+                # Slot write_idx still holds frame_id - 2: readers of it must retry
+                self._writing = frame_id
+                try:
+                    # Copy straight out of the DMA buffers into the back slot;
+                    # frames stay YUV420 (I420) until a consumer asks for RGB
+                    for stream, buffers in self._buffers.items():
+                        with MappedArray(request, stream) as mapped:
+                            np.copyto(buffers[write_idx], mapped.array)
+                finally:
+                    request.release()
+
                 with self.frame_lock:
-                    self.frame = frame
+                    self._front = (frame_id, write_idx)
+                    self.frame_available = True
+                    self._frames_captured = frame_id
+                    self._frame_cond.notify_all()
             except Exception as e:
                 print(f"Capture error: {e}")
                 time.sleep(0.01)
 
+    def _preprocess_loop(self):
+        """Turn the newest captured frame into YOLO/stream outputs, skipping stale ones"""
+        last_seen = 0
+        while self.running:
+            with self._frame_cond:
+                self._frame_cond.wait_for(
+                    lambda: self._frames_captured != last_seen or not self.running,
+                    timeout=1.0,
+                )
+                if self._frames_captured == last_seen:
+                    continue
+            last_seen, idx = self._front
+            # Convert both streams from the same capture
+            # Main is only used for the preview, which OpenCV encodes from BGR
+            frame = cv2.cvtColor(self._buffers["main"][idx],
+                                 cv2.COLOR_YUV2BGR_I420, dst=self._main_bgr)
+            lores = cv2.cvtColor(self._buffers["lores"][idx],
+                                 cv2.COLOR_YUV2RGB_I420, dst=self._lores_rgb)
+            if self._is_torn(last_seen):
+                continue  # Fell two frames behind; take the newest one instead
+            try:
+                self._preprocess_frame(frame, lores, last_seen)
+            except Exception as e:
+                print(f"Preprocess error: {e}")
+
+    def _preprocess_frame(self, frame_bgr: np.ndarray, lores: np.ndarray, frame_id: int):
+        """Run stretch/letterbox/normalize and the preview encode once, then publish"""
+        # Stretch range comes from the whole lores frame; the stretch itself is
+        # applied after letterboxing so it only touches YOLO_SIZE pixels
+        lows, highs = self._stretch_bounds(lores)
+        letterboxed = self._letterbox(lores)
+        meta = dict(self._letterbox_meta, frame_id=frame_id)
+
+        # Fill the output buffers that readers are not using
+        front, _ = self._yolo_slot
+        yolo_frame = self._yolo_buffers[1] if front is self._yolo_buffers[0] else self._yolo_buffers[0]
+        self._contrast_stretch(letterboxed, lows, highs, yolo_frame)
+        front, _ = self._tensor_slot
+        tensor = self._tensor_buffers[1] if front is self._tensor_buffers[0] else self._tensor_buffers[0]
+        self._normalize(letterboxed, lows, highs, tensor)
+        ok, encoded = cv2.imencode('.jpg', frame_bgr, _STREAM_JPEG_PARAMS)
+        if not ok:
+            raise RuntimeError("Preview JPEG encode failed")
+        jpeg = encoded.tobytes()
+
+        with self._yolo_lock:
+            self._yolo_slot = (yolo_frame, meta)
+        with self.tensor_lock:
+            self._tensor_slot = (tensor, meta)
+        with self._batch_cond:
+            if len(self._pending) == config.YOLO_BATCH_MAX:
+                self._pending = []  # Nobody collected this batch; start a fresh one
+            np.copyto(self._batch_buffers[self._batch_fill][len(self._pending)], tensor)
+            self._pending.append(meta)
+            self._batch_cond.notify_all()
+        with self._jpeg_cond:
+            self._jpeg_slot = jpeg
+            self._jpeg_cond.notify_all()
+
     @staticmethod
-    def _contrast_stretch(frame: np.ndarray) -> np.ndarray:
+    def _stretch_bounds(frame: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
         """
-        Per-channel percentile stretch - LOGO-OPTIMIZED
+        Per-channel percentile range - LOGO-OPTIMIZED
         
         For logo detection, we use LESS aggressive stretching to preserve
         true brand colors. Aggressive stretching can shift distinctive
         brand colors that are key features for logo recognition.
         
-        Set CONTRAST_STRETCH_ENABLED=False for color-critical logo applications.
+        Set CONTRAST_STRETCH_ENABLED=False for color-critical logo applications
+        (the returned range is then the identity 0..255).
         """
+        lows = np.zeros(3, dtype=np.float32)
+        highs = np.full(3, 255.0, dtype=np.float32)
         if not config.CONTRAST_STRETCH_ENABLED:
-            return frame  # Return original for color-critical logos
-            
-        frame_f = frame.astype(np.float32)
+            return lows, highs  # Identity range for color-critical logos
+
         low_pct = config.CONTRAST_PERCENTILE_LOW    # Default: 1
         high_pct = config.CONTRAST_PERCENTILE_HIGH  # Default: 99
-        
-        lows = np.percentile(frame_f, low_pct, axis=(0, 1)).reshape(1, 1, 3)
-        highs = np.percentile(frame_f, high_pct, axis=(0, 1)).reshape(1, 1, 3)
-        stretched = (frame_f - lows) / (highs - lows + 1e-3)
-        stretched = np.clip(stretched, 0.0, 1.0)
-        return (stretched * 255.0).astype(np.uint8)
+
+        # Percentiles from 256-bin histograms: O(N) over uint8, no sort, no float copy.
+        # cv2.calcHist reads the interleaved channel in place (no strided ravel copy)
+        total = frame.shape[0] * frame.shape[1]
+        for c in range(3):
+            hist = cv2.calcHist([frame], [c], None, [256], (0, 256))
+            cum = np.cumsum(hist.ravel(), dtype=np.float64)
+            lows[c] = np.searchsorted(cum, total * low_pct / 100.0)
+            highs[c] = np.searchsorted(cum, total * high_pct / 100.0) + 1e-3
+        return lows, highs
+
+    def _contrast_stretch(self, frame: np.ndarray, lows: np.ndarray, highs: np.ndarray,
+                          out: np.ndarray) -> np.ndarray:
+        """Apply the per-channel stretch to a uint8 frame via a (3, 256) lookup table"""
+        scale = 255.0 / (highs - lows)
+        lut = np.clip((self._levels[None, :] - lows[:, None]) * scale[:, None], 0.0, 255.0).astype(np.uint8)
+        for c in range(3):
+            np.take(lut[c], frame[:, :, c], out=out[:, :, c])
+        return out
 
     @staticmethod
-    def _letterbox(frame: np.ndarray, target_size: tuple[int, int]) -> tuple[np.ndarray, dict]:
-        """Resize with aspect-ratio preservation and black padding"""
+    def _letterbox_layout(src_size: tuple[int, int], target_size: tuple[int, int],
+                          canvas: np.ndarray) -> tuple[np.ndarray, dict]:
+        """Compute the aspect-preserving image region of canvas and its YOLO meta"""
+        w, h = src_size
         target_w, target_h = target_size
-        image = Image.fromarray(frame)
-        contained = ImageOps.contain(image, (target_w, target_h), method=Image.BICUBIC)
-        canvas = Image.new("RGB", (target_w, target_h), color=(0, 0, 0))
-        offset = ((target_w - contained.width) // 2, (target_h - contained.height) // 2)
-        canvas.paste(contained, offset)
+        scale = min(target_w / w, target_h / h)
+        new_w, new_h = int(w * scale), int(h * scale)
+        pad_x = (target_w - new_w) // 2
+        pad_y = (target_h - new_h) // 2
+        roi = canvas[pad_y:pad_y + new_h, pad_x:pad_x + new_w]
         meta = {
-            "scale": contained.width / image.width,
-            "pad": offset,
-            "original_size": image.size,
+            # Report scale against the sensor frame so boxes map back to SENSOR_SIZE
+            "scale": new_w / config.SENSOR_SIZE[0],
+            "pad": (pad_x, pad_y),
+            "original_size": config.SENSOR_SIZE,
         }
-        return np.array(canvas), meta
+        return roi, meta
 
-    @staticmethod
-    def _normalize(frame: np.ndarray) -> np.ndarray:
-        """Normalize frame to CHW float32 tensor using ImageNet stats"""
-        mean = np.array(config.NORMALIZE_MEAN, dtype=np.float32)
-        std = np.array(config.NORMALIZE_STD, dtype=np.float32)
-        tensor = frame.astype(np.float32) / 255.0
-        tensor = (tensor - mean) / std
-        return np.transpose(tensor, (2, 0, 1))  # CHW
+    def _letterbox(self, frame: np.ndarray) -> np.ndarray:
+        """Place frame into the pre-padded YOLO canvas, resizing only if needed"""
+        roi = self._letterbox_roi
+        if frame.shape[:2] == roi.shape[:2]:
+            np.copyto(roi, frame)  # lores already sized to fit; padding is static
+        else:
+            h, w = roi.shape[:2]
+            interpolation = cv2.INTER_AREA if w < frame.shape[1] else cv2.INTER_LINEAR
+            cv2.resize(frame, (w, h), dst=roi, interpolation=interpolation)
+        return self._letterboxed
+
+    def _normalize(self, frame: np.ndarray, lows: np.ndarray, highs: np.ndarray,
+                   out: np.ndarray) -> np.ndarray:
+        """Stretch + normalize frame into a CHW float32 tensor using ImageNet stats"""
+        # Multiplying by the cached 1/std is cheaper than dividing per pixel
+        _preprocess(frame, lows, highs, self._mean, self._inv_std, out)
+        return out
                 
-    def get_frame(self):
-        """Get latest frame (thread-safe)"""
-        with self.frame_lock:
-            return self.frame.copy() if self.frame is not None else None
+    @property
+    def frame_id(self) -> int:
+        """Id of the latest capture; increases by one per frame, 0 before the first"""
+        return self._frames_captured
+
+    def _is_torn(self, frame_id: int) -> bool:
+        """True if the capture thread started overwriting frame_id's buffer slot"""
+        # Slots alternate, so frame_id's slot is reused by frame_id + 2
+        return self._writing > frame_id + 1
+
+    def _cached(self, key, frame_id: int, build):
+        """Return build() for this frame, reusing the result of an earlier call"""
+        with self._cache_lock:
+            hit = self._frame_cache.get(key)
+        if hit is not None and hit[0] == frame_id:
+            return hit[1]
+        value = build()
+        if value is not None:  # None = build gave up (torn read); don't cache
+            with self._cache_lock:
+                self._frame_cache[key] = (frame_id, value)
+        return value
+
+    def get_frame_with_id(self, stream: str = "main"):
+        """
+        Get latest frame as RGB plus its frame id from the "main" or "lores" stream
+
+        The RGB array is shared by every caller asking for the same frame;
+        treat it as read-only.
+        """
+        while True:
+            frame_id, idx = self._front
+            if frame_id == 0:
+                return None, None
+
+            def convert():
+                # The result is a new array, so no copy is needed once validated
+                rgb = cv2.cvtColor(self._buffers[stream][idx], cv2.COLOR_YUV2RGB_I420)
+                return None if self._is_torn(frame_id) else rgb
+
+            frame = self._cached(("rgb", stream), frame_id, convert)
+            if frame is not None:
+                return frame, frame_id
+
+    def get_frame(self, stream: str = "main"):
+        """Get latest frame as RGB (thread-safe) from the "main" or "lores" stream"""
+        return self.get_frame_with_id(stream)[0]
     
     def get_frame_for_yolo(self, normalize: bool = False):
-        """Return preprocessed frame (and metadata) ready for YOLO"""
-        frame = self.get_frame()
-        if frame is None:
-            return None, None
-
-        balanced = self._contrast_stretch(frame)
-        yolo_frame, meta = self._letterbox(balanced, config.YOLO_SIZE)
+        """
+        Return latest preprocessed frame (and metadata) ready for YOLO
 
+        Both outputs are reused buffers that the preprocess thread recycles
+        two frames later; copy them if they must outlive the current request.
+        """
         if normalize:
-            return self._normalize(yolo_frame), meta
-        return yolo_frame, meta
+            with self.tensor_lock:
+                return self._tensor_slot
+        with self._yolo_lock:
+            return self._yolo_slot
     
+    def _encode_jpeg(self, frame: np.ndarray, quality: int) -> bytes:
+        """Encode an RGB frame with TurboJPEG (4:2:0 chroma, like PIL's default)"""
+        return self._tj.encode(frame, quality=quality, pixel_format=TJPF_RGB,
+                               jpeg_subsample=TJSAMP_420)
+
     def get_frame_jpeg(self, quality=None):
         """Get frame as JPEG bytes"""
-        frame = self.get_frame()
+        return self.get_frame_jpeg_with_id(quality)[0]
+
+    def get_frame_jpeg_with_id(self, quality=None):
+        """Get frame as JPEG bytes plus its frame id, encoding once per frame and quality"""
+        frame, frame_id = self.get_frame_with_id()
         if frame is None:
-            return None
-        img = Image.fromarray(frame)
-        buffer = io.BytesIO()
-        img.save(buffer, format='JPEG', quality=quality or config.JPEG_QUALITY)
-        return buffer.getvalue()
+            return None, None
+        quality = quality or config.JPEG_QUALITY
+        jpeg = self._cached(("jpeg", quality), frame_id,
+                            lambda: self._encode_jpeg(frame, quality))
+        return jpeg, frame_id
+
+    def get_stream_jpeg(self, last=None, timeout: float = 1.0):
+        """
+        Wait for a preview JPEG newer than last (from the preprocess thread)
+
+        Returns None if nothing new arrives within timeout seconds.
+        """
+        with self._jpeg_cond:
+            self._jpeg_cond.wait_for(
+                lambda: self._jpeg_slot is not None and self._jpeg_slot is not last,
+                timeout=timeout,
+            )
+            jpeg = self._jpeg_slot
+        return jpeg if jpeg is not last else None
 
     def get_yolo_frame_jpeg(self):
         """Get letterboxed/preprocessed frame as JPEG"""
-        frame, meta = self.get_frame_for_yolo()
-        if frame is None:
-            return None, None
-        img = Image.fromarray(frame)
-        buffer = io.BytesIO()
-        img.save(buffer, format='JPEG', quality=config.JPEG_QUALITY)
-        return buffer.getvalue(), meta
+        # Encode under the slot lock: the frame is a reused buffer
+        with self._yolo_lock:
+            frame, meta = self.get_frame_for_yolo()
+            if frame is None:
+                return None, None
+            jpeg = self._cached("yolo_jpeg", meta["frame_id"],
+                                lambda: self._encode_jpeg(frame, config.JPEG_QUALITY))
+            return jpeg, meta
 
     def get_yolo_tensor(self):
-        """Get normalized CHW tensor for direct YOLO inference"""
+        """
+        Get normalized C-contiguous CHW tensor for direct YOLO inference
+
+        The tensor is a reused buffer: hold tensor_lock while reading it
+        so the preprocess thread cannot recycle it.
+        """
         tensor, meta = self.get_frame_for_yolo(normalize=True)
         return tensor, meta
     
+    def get_yolo_batch(self, max_batch: int = 4, wait_ms: int = 20):
+        """
+        Collect up to max_batch recent tensors as one (N, 3, H, W) float32 array
+
+        Waits at most wait_ms for the batch to fill and returns whatever
+        arrived, newest last, plus per-frame metadata. If nothing new arrived,
+        waits up to one more frame period, then falls back to the latest tensor
+        (a batch of one). Returns (None, None) only if no frame has been
+        produced yet. The array is a reused buffer: hold batch_lock while
+        reading it.
+        """
+        max_batch = max(1, min(max_batch, config.YOLO_BATCH_MAX))
+        with self.batch_lock, self._batch_cond:
+            self._batch_cond.wait_for(lambda: len(self._pending) >= max_batch,
+                                      timeout=wait_ms / 1000)
+            if not self._pending:
+                # Back-to-back calls drain the batch: give the next frame a chance
+                self._batch_cond.wait_for(lambda: self._pending,
+                                          timeout=1.5 / config.FRAME_RATE)
+            if not self._pending:
+                with self.tensor_lock:
+                    tensor, meta = self._tensor_slot
+                    if tensor is None:
+                        return None, None
+                    batch = self._batch_buffers[self._batch_fill][:1]
+                    np.copyto(batch[0], tensor)
+                self._batch_fill = 1 - self._batch_fill
+                return batch, [meta]
+            count = len(self._pending)
+            start = max(0, count - max_batch)
+            batch = self._batch_buffers[self._batch_fill][start:count]
+            metas = self._pending[start:count]
+            # Hand this buffer to the caller and fill the other one from now on
+            self._batch_fill = 1 - self._batch_fill
+            self._pending = []
+        return batch, metas
+
     def save_frame(self, filename=None):
         """Save current frame to disk"""
         frame = self.get_frame()
@@ -304,7 +669,9 @@ class CameraStream:
             filename = f"capture_{timestamp}.jpg"
         
         filepath = os.path.join(config.SAVE_FOLDER, filename)
-        img = Image.fromarray(frame)
+        # Zero-copy view over the C-contiguous RGB frame from get_frame()
+        h, w = frame.shape[:2]
+        img = Image.frombuffer('RGB', (w, h), frame, 'raw', 'RGB', 0, 1)
         img.save(filepath, format='JPEG', quality=95)
         return filename, None
         
@@ -313,6 +680,8 @@ class CameraStream:
         self.running = False
         if hasattr(self, 'capture_thread'):
             self.capture_thread.join(timeout=1.0)
+        if hasattr(self, 'preprocess_thread'):
+            self.preprocess_thread.join(timeout=1.0)
         self.picam2.stop()
         self.picam2.close()
 
@@ -328,19 +697,30 @@ def cleanup():
 
 atexit.register(cleanup)
 
+# Frame ids restart at 0 with the server, so ETags carry a per-run token too
+_ETAG_RUN = f"{int(time.time()):x}"
+
+def _tag_frame(response, frame_id: int, variant: str = ""):
+    """Add X-Frame-Id/ETag headers and answer If-None-Match with 304"""
+    response.headers['X-Frame-Id'] = str(frame_id)
+    response.set_etag(f"{_ETAG_RUN}-{frame_id}{variant}")
+    return response.make_conditional(request)
+
 # =============================================================================
 # VIDEO STREAMING
 # =============================================================================
 def generate_frames():
     """Generate MJPEG stream for web browser"""
+    # Each preview JPEG is encoded once by the preprocess thread and shared by
+    # every viewer; wait for the next one instead of polling
+    last_sent = None
     while True:
         try:
-            jpeg_bytes = camera.get_frame_jpeg(quality=70)
+            jpeg_bytes = camera.get_stream_jpeg(last_sent, timeout=1.0)
             if jpeg_bytes:
+                last_sent = jpeg_bytes
                 yield (b'--frame\r\n'
                        b'Content-Type: image/jpeg\r\n\r\n' + jpeg_bytes + b'\r\n')
-            else:
-                time.sleep(0.01)
         except Exception as e:
             print(f"Stream error: {e}")
             continue
@@ -394,7 +774,8 @@ button.secondary{background:linear-gradient(135deg,#4a9eff,#2979ff)}
 <h3>📡 API Endpoints</h3>
 <div class="endpoint"><code>GET /frame</code> - Raw JPEG frame (browser friendly)</div>
 <div class="endpoint"><code>GET /frame/yolo</code> - Letterboxed + color balanced JPEG</div>
-<div class="endpoint"><code>GET /frame/yolo/tensor</code> - Normalized CHW tensor (.npy)</div>
+<div class="endpoint"><code>GET /frame/yolo/tensor?dtype=fp16</code> - Normalized CHW tensor (.npy, fp32/fp16/int8)</div>
+<div class="endpoint"><code>GET /frame/yolo/batch?n=4</code> - Recent tensors stacked NCHW (.npy)</div>
 <div class="endpoint"><code>GET /frame/raw</code> - Sensor capture as NumPy array</div>
 <div class="endpoint"><code>GET /frame/numpy</code> - Frame/meta info</div>
 <div class="endpoint"><code>GET /video_feed</code> - MJPEG stream</div>
@@ -435,25 +816,26 @@ def get_frame():
         img = Image.open(io.BytesIO(resp.content))
         results = model(img)
     """
-    jpeg_bytes = camera.get_frame_jpeg()
+    jpeg_bytes, frame_id = camera.get_frame_jpeg_with_id()
     if jpeg_bytes is None:
         return jsonify({"error": "No frame available"}), 503
-    return Response(jpeg_bytes, mimetype='image/jpeg')
+    return _tag_frame(Response(jpeg_bytes, mimetype='image/jpeg'), frame_id)
 
 @app.route('/frame/raw')
 def get_frame_raw():
     """Download raw sensor frame as NumPy array"""
-    frame = camera.get_frame()
+    frame, frame_id = camera.get_frame_with_id()
     if frame is None:
         return jsonify({"error": "No frame available"}), 503
-    buffer = io.BytesIO()
-    np.save(buffer, frame, allow_pickle=False)
-    buffer.seek(0)
-    return Response(
-        buffer.getvalue(),
+    # get_frame returns a C-contiguous array: cached header + one copy of
+    # the pixels instead of np.save into a BytesIO and getvalue()
+    response = Response(
+        [_npy_header(frame.shape, frame.dtype.str), frame.tobytes()],
         mimetype='application/octet-stream',
-        headers={'Content-Disposition': 'attachment; filename="sensor_frame.npy"'}
+        headers={'Content-Disposition': 'attachment; filename="sensor_frame.npy"'},
+        direct_passthrough=True,
     )
+    return _tag_frame(response, frame_id, "-raw")
 
 @app.route('/frame/yolo')
 def get_frame_yolo():
@@ -465,28 +847,63 @@ def get_frame_yolo():
     if meta:
         response.headers['X-YOLO-Scale'] = str(meta['scale'])
         response.headers['X-YOLO-Pad'] = str(meta['pad'])
-    return response
+    return _tag_frame(response, meta['frame_id'], "-yolo")
 
 @app.route('/frame/yolo/tensor')
 def get_frame_yolo_tensor():
-    """Get normalized CHW tensor encoded as NumPy .npy"""
-    tensor, meta = camera.get_yolo_tensor()
-    if tensor is None:
-        return jsonify({"error": "No frame available"}), 503
-    buffer = io.BytesIO()
-    payload = {
-        "tensor": tensor,
-        "meta": meta,
-        "normalize_mean": config.NORMALIZE_MEAN,
-        "normalize_std": config.NORMALIZE_STD,
-    }
-    np.save(buffer, payload, allow_pickle=True)
-    buffer.seek(0)
-    return Response(
-        buffer.getvalue(),
+    """
+    Get normalized CHW tensor encoded as NumPy .npy (no pickle)
+
+    ?dtype=fp32 (default), fp16 or int8 shrinks the payload 2x/4x.
+    Metadata travels in headers:
+        X-Tensor-Shape, X-Tensor-Dtype, X-YOLO-Scale, X-YOLO-Pad,
+        X-Normalize-Mean, X-Normalize-Std, X-Quant-Scale/X-Quant-Zero-Point (int8)
+    """
+    dtype = request.args.get('dtype', 'fp32').lower()
+    if dtype not in ('fp32', 'fp16', 'int8'):
+        return jsonify({"error": "dtype must be fp32, fp16 or int8"}), 400
+    with camera.tensor_lock:
+        tensor, meta = camera.get_yolo_tensor()
+        if tensor is None:
+            return jsonify({"error": "No frame available"}), 503
+        tensor, quant_scale = _quantize(tensor, dtype)
+        body = [_npy_header(tensor.shape, tensor.dtype.str), tensor.tobytes()]
+    response = Response(
+        body,
         mimetype='application/octet-stream',
         headers={'Content-Disposition': 'attachment; filename="yolo_tensor.npy"'}
     )
+    response.headers['X-Tensor-Shape'] = ','.join(map(str, tensor.shape))
+    response.headers['X-Tensor-Dtype'] = str(tensor.dtype)
+    response.headers['X-YOLO-Scale'] = str(meta['scale'])
+    response.headers['X-YOLO-Pad'] = str(meta['pad'])
+    response.headers['X-Normalize-Mean'] = ','.join(map(str, config.NORMALIZE_MEAN))
+    response.headers['X-Normalize-Std'] = ','.join(map(str, config.NORMALIZE_STD))
+    if dtype == 'int8':
+        response.headers['X-Quant-Scale'] = str(quant_scale)
+        response.headers['X-Quant-Zero-Point'] = '0'
+    return _tag_frame(response, meta['frame_id'], f"-{dtype}")
+
+@app.route('/frame/yolo/batch')
+def get_frame_yolo_batch():
+    """Get up to ?n= recent normalized tensors stacked as an NCHW .npy"""
+    n = request.args.get('n', 4, type=int)
+    with camera.batch_lock:
+        batch, metas = camera.get_yolo_batch(max_batch=n)
+        if batch is None:
+            return jsonify({"error": "No frame available"}), 503
+        body = [_npy_header(batch.shape, batch.dtype.str), batch.tobytes()]
+    # Letterbox geometry is fixed, so every frame in the batch shares it
+    response = Response(
+        body,
+        mimetype='application/octet-stream',
+        headers={'Content-Disposition': 'attachment; filename="yolo_batch.npy"'}
+    )
+    response.headers['X-Batch-Size'] = str(len(metas))
+    response.headers['X-Frame-Ids'] = ','.join(str(m['frame_id']) for m in metas)
+    response.headers['X-YOLO-Scale'] = str(metas[0]['scale'])
+    response.headers['X-YOLO-Pad'] = str(metas[0]['pad'])
+    return response
 
 @app.route('/frame/numpy')
 def get_frame_info():
@@ -508,15 +925,16 @@ def get_frame_info():
         "scale": meta["scale"] if meta else 1.0,
         "padding": meta["pad"] if meta else (0, 0),
         "original_size": meta["original_size"] if meta else config.SENSOR_SIZE,
+        "frame_id": meta["frame_id"] if meta else None,
     })
 
 @app.route('/status')
 def get_status():
     """Camera and server status"""
-    frame = camera.get_frame()
     return jsonify({
         "camera_running": camera.running,
-        "frame_available": frame is not None,
+        "frame_available": camera.frame_available,
+        "frame_id": camera.frame_id,
         "sensor_resolution": config.SENSOR_SIZE,
         "yolo_resolution": config.YOLO_SIZE,
         "frame_rate": config.FRAME_RATE,
@@ -550,6 +968,7 @@ if __name__ == '__main__':
     print("   📡 API Endpoints:")
     print("   → GET /frame/yolo        - Preprocessed JPEG")
     print("   → GET /frame/yolo/tensor - Normalized tensor (.npy)")
+    print("   → GET /frame/yolo/batch  - Batched tensors (.npy)")
     print("   → GET /frame/raw         - Sensor capture (.npy)")
     print("   → POST /save_picture     - Save for training data")
     print("   → GET /status            - Camera status")
@@ -1,19 +1,58 @@
-from flask import Flask, Response, request, jsonify
+from flask import Flask, Response, request
+from flask.json.provider import DefaultJSONProvider
 from picamera2 import Picamera2
 from picamera2.encoders import H264Encoder, MJPEGEncoder, Quality
-from picamera2.outputs import FileOutput, FfmpegOutput
-import io
+from picamera2.outputs import FileOutput, FfmpegOutput, Output
 import atexit
 import numpy as np
-from PIL import Image
+from turbojpeg import TurboJPEG, TJPF_RGB, TJSAMP_420
 import os
 from datetime import datetime
 import threading
 import time
 import subprocess
+import hashlib
+import json
+import io
+import socket
+import logging
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from fractions import Fraction
+
+try:
+    import av  # PyAV: in-process remux; ffmpeg CLI is the fallback
+except ImportError:  # pragma: no cover
+    av = None
+
+try:
+    import orjson  # Fast JSON encoder; stdlib json is the fallback
+except ImportError:  # pragma: no cover
+    orjson = None
 
 app = Flask(__name__)
 
+if orjson is not None:
+    class OrjsonProvider(DefaultJSONProvider):
+        """Route Flask's own JSON handling through orjson"""
+        def dumps(self, obj, **kwargs):
+            return orjson.dumps(obj).decode()
+
+        def loads(self, s, **kwargs):
+            return orjson.loads(s)
+
+    app.json = OrjsonProvider(app)
+
+def json_bytes(obj):
+    """Encode obj as JSON bytes (orjson when available)"""
+    return orjson.dumps(obj) if orjson is not None else json.dumps(obj).encode()
+
+def ojson(obj, status=200):
+    """JSON response encoded straight to bytes (orjson when available)"""
+    return Response(json_bytes(obj), status=status, mimetype='application/json')
+
 # =============================================================================
 # CONFIGURATION - Normal Display Mode (Auto Settings)
 # =============================================================================
@@ -25,9 +64,11 @@ class Config:
     VIDEO_SIZE = (1920, 1080)   # Full HD for recording
     VIDEO_BITRATE = 15000000    # 15 Mbps for high quality (adjust: 10-25 Mbps)
     VIDEO_FPS = 30              # Frame rate for video
+    VIDEO_WRITE_BUFFER = 1 << 20  # Bytes batched per write() of the .h264 file
     
     FRAME_RATE = 30
     JPEG_QUALITY = 80           # Good quality for streaming
+    STREAM_QUALITY = Quality.MEDIUM  # MJPEGEncoder preset for /video_feed (hardware)
     SAVE_FOLDER = "/home/ali/CAMERA_NORMAL"
     VIDEO_FOLDER = "/home/ali/CAMERA_NORMAL/videos"
 
@@ -40,23 +81,126 @@ config = Config()
 os.makedirs(config.SAVE_FOLDER, exist_ok=True)
 os.makedirs(config.VIDEO_FOLDER, exist_ok=True)
 
+# =============================================================================
+# LOGGING - Hot-path errors go through a queue instead of print()
+# =============================================================================
+# Capture/stream threads only enqueue records; a listener thread does the
+# formatting and the write() to stderr
+log = logging.getLogger("live_cam_normal")
+log.setLevel(logging.INFO)
+log.propagate = False
+_log_queue = SimpleQueue()
+log.addHandler(QueueHandler(_log_queue))
+_log_listener = QueueListener(_log_queue, logging.StreamHandler())
+_log_listener.start()
+
+_last_logged = {}
+
+def log_throttled(key, msg, *args, interval=1.0):
+    """Log a warning (with the active exception) at most once per interval per key"""
+    now = time.monotonic()
+    if now - _last_logged.get(key, 0.0) >= interval:
+        _last_logged[key] = now
+        log.warning(msg, *args, exc_info=True)
+
+# =============================================================================
+# H.264 FILE WRITER - Batch encoded packets into large writes
+# =============================================================================
+class BatchedFileWriter(io.BufferedWriter):
+    """
+    Buffered file whose flush() is a no-op until close()
+
+    picamera2's FileOutput flushes after every packet, i.e. one write()
+    syscall per frame; this lets packets pile up to buffer_size first.
+    """
+    def __init__(self, path, buffer_size=config.VIDEO_WRITE_BUFFER):
+        super().__init__(io.FileIO(path, 'wb'), buffer_size=buffer_size)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if not self.closed:
+            super().flush()
+        super().close()
+
+# =============================================================================
+# MJPEG OUTPUT - Latest hardware-encoded JPEGs for the browser stream
+# =============================================================================
+class JpegBroadcaster(Output):
+    """picamera2 Output that fans each MJPEGEncoder frame out to every stream client"""
+    def __init__(self, client_depth: int = 2):
+        super().__init__()
+        self.client_depth = client_depth
+        self._clients = {}  # id(queue) -> queue (deques are unhashable)
+        self._cond = threading.Condition()
+        self._latest = None
+
+    def outputframe(self, frame, keyframe=True, timestamp=None, *args, **kwargs):
+        """Push one encoded JPEG to every client queue and wake the streams"""
+        jpeg = bytes(frame)
+        with self._cond:
+            self._latest = jpeg
+            for queue in self._clients.values():
+                queue.append(jpeg)  # Bounded: slow clients drop stale frames
+            self._cond.notify_all()
+
+    def latest(self):
+        """Most recent JPEG, or None before the first frame"""
+        return self._latest
+
+    def subscribe(self):
+        """Register a new client and return its frame queue"""
+        queue = deque(maxlen=self.client_depth)
+        with self._cond:
+            self._clients[id(queue)] = queue
+        return queue
+
+    def unsubscribe(self, queue):
+        """Stop delivering frames to queue"""
+        with self._cond:
+            self._clients.pop(id(queue), None)
+
+    def get(self, queue, timeout: float = 1.0):
+        """Oldest queued JPEG for this client; None if nothing arrives in time"""
+        with self._cond:
+            self._cond.wait_for(lambda: queue, timeout=timeout)
+            return queue.popleft() if queue else None
+
 # =============================================================================
 # CAMERA CLASS - Simple streaming with VIDEO RECORDING
 # =============================================================================
 class CameraStream:
     def __init__(self):
         self.picam2 = Picamera2()
-        self.frame = None
+        # Latest CompletedRequest; its DMA buffer is only copied when a
+        # reader actually needs pixels (see get_frame)
+        self.frame_req = None
         self.frame_lock = threading.Lock()
         self.running = False
         
         # Video recording state
         self.is_recording = False
         self.recording_lock = threading.Lock()
+        # Notified on every start/stop/remux change; drives /record/events
+        self.recording_changed = threading.Condition(self.recording_lock)
+        self._recording_version = 0
         self.current_video_file = None
         self.encoder = None
         self.output = None
+        self.video_file = None
         self.recording_start_time = None
+
+        # H.264 -> MP4 remuxes run here so /record/stop returns immediately
+        self._remux_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="remux")
+        self._pending_remuxes = {}  # filename -> Future, guarded by recording_lock
+        # Outcomes of recent remuxes for status clients, guarded by recording_lock
+        self._finished_remuxes = deque(maxlen=8)
+
+        # Browser stream: JPEGs come straight from the MJPEG encoder
+        self.jpeg_encoder = MJPEGEncoder()
+        self.jpeg_output = JpegBroadcaster()
+        self._tj = TurboJPEG()  # libjpeg-turbo SIMD encoder for software JPEGs
         
         self._configure_camera()
         
@@ -70,7 +214,7 @@ class CameraStream:
             controls={
                 "FrameRate": config.FRAME_RATE,
             },
-            buffer_count=4
+            buffer_count=6  # Held frame_req + MJPEG/H.264 encoders must not starve the camera
         )
         self.picam2.configure(cam_config)
         
@@ -86,6 +230,11 @@ class CameraStream:
             "AfSpeed": 1,     # Normal AF speed (0=normal, 1=fast)
         })
         
+        # Second encoder next to the H.264 recorder: the stream never goes
+        # through capture_array or a software JPEG encode
+        self.picam2.start_encoder(self.jpeg_encoder, self.jpeg_output,
+                                  quality=config.STREAM_QUALITY, name="main")
+        
         self.running = True
         self.capture_thread = threading.Thread(target=self._capture_loop, daemon=True)
         self.capture_thread.start()
@@ -94,29 +243,49 @@ class CameraStream:
         
     def _capture_loop(self):
         """Continuous frame capture for low latency"""
+        capture_request = self.picam2.capture_request
+        frame_lock = self.frame_lock
         while self.running:
             try:
-                frame = self.picam2.capture_array()
-                with self.frame_lock:
-                    self.frame = frame
+                req = capture_request()
+                with frame_lock:
+                    old, self.frame_req = self.frame_req, req
+                if old is not None:
+                    old.release()  # Recycled once readers drop their references
             except Exception as e:
-                print(f"Capture error: {e}")
+                log_throttled("capture", "Capture error: %s", e)
                 time.sleep(0.01)
                 
+    @property
+    def frame_available(self):
+        """True once the first frame has been captured"""
+        return self.frame_req is not None
+
     def get_frame(self):
         """Get latest frame (thread-safe)"""
         with self.frame_lock:
-            return self.frame.copy() if self.frame is not None else None
+            req = self.frame_req
+            if req is None:
+                return None
+            req.acquire()  # Keep the buffer out of the camera until we've read it
+        try:
+            # make_array copies out of the DMA buffer, so no extra .copy()
+            return req.make_array("main")
+        finally:
+            req.release()
     
     def get_frame_jpeg(self, quality=None):
-        """Get frame as JPEG bytes"""
+        """Get frame as JPEG bytes (the stream's hardware JPEG unless quality is given)"""
+        if quality is None:
+            jpeg = self.jpeg_output.latest()
+            if jpeg is not None:
+                return jpeg
         frame = self.get_frame()
         if frame is None:
             return None
-        img = Image.fromarray(frame)
-        buffer = io.BytesIO()
-        img.save(buffer, format='JPEG', quality=quality or config.JPEG_QUALITY)
-        return buffer.getvalue()
+        # "BGR888" arrays are RGB-ordered on this camera (PIL showed correct colors)
+        return self._tj.encode(frame, quality=quality or config.JPEG_QUALITY,
+                               pixel_format=TJPF_RGB, jpeg_subsample=TJSAMP_420)
     
     def save_frame(self, filename=None):
         """Save current frame to disk"""
@@ -129,8 +298,11 @@ class CameraStream:
             filename = f"capture_{timestamp}.jpg"
         
         filepath = os.path.join(config.SAVE_FOLDER, filename)
-        img = Image.fromarray(frame)
-        img.save(filepath, format='JPEG', quality=90)
+        # Same RGB-ordered buffer as get_frame_jpeg: no channel reversal needed
+        jpeg = self._tj.encode(frame, quality=90, pixel_format=TJPF_RGB,
+                               jpeg_subsample=TJSAMP_420)
+        with open(filepath, 'wb') as f:
+            f.write(jpeg)
         return filename, None
     
     # =========================================================================
@@ -147,10 +319,13 @@ class CameraStream:
                 return None, "Already recording"
             
             try:
-                # Generate filename with timestamp
+                # Generate filename with timestamp; milliseconds keep a quick
+                # stop -> start from reusing a name that is still finalizing
                 if filename is None:
-                    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+                    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")[:-3]
                     filename = f"video_{timestamp}.mp4"
+                if filename in self._pending_remuxes:
+                    return None, f"{filename} is still being finalized"
                 
                 # Use .h264 extension for raw recording, convert to MP4 on stop
                 h264_filename = filename.replace('.mp4', '.h264')
@@ -162,8 +337,9 @@ class CameraStream:
                     bitrate=config.VIDEO_BITRATE,
                 )
                 
-                # Use FileOutput for raw H.264 stream
-                self.output = FileOutput(self.h264_path)
+                # Use FileOutput for raw H.264 stream, written in large batches
+                self.video_file = BatchedFileWriter(self.h264_path)
+                self.output = FileOutput(self.video_file)
                 
                 # Start recording on the main stream
                 self.picam2.start_encoder(self.encoder, self.output, name="main")
@@ -171,6 +347,7 @@ class CameraStream:
                 self.is_recording = True
                 self.current_video_file = filename
                 self.recording_start_time = time.time()
+                self._notify_recording_change()
                 
                 print(f"🎬 Recording started: {filename}")
                 print(f"   Temp file: {self.h264_path}")
@@ -180,6 +357,9 @@ class CameraStream:
                 
             except Exception as e:
                 self.is_recording = False
+                if self.video_file is not None:
+                    self.video_file.close()
+                    self.video_file = None
                 print(f"❌ Recording error: {e}")
                 import traceback
                 traceback.print_exc()
@@ -187,101 +367,222 @@ class CameraStream:
                 return None, str(e)
     
     def stop_recording(self):
-        """Stop video recording, convert to MP4, and finalize file"""
+        """Stop video recording; MP4 conversion continues in the background"""
+        # recording_lock only guards the state transition; the encoder shutdown
+        # below runs without it so status polls never wait on the hardware
         with self.recording_lock:
             if not self.is_recording:
                 return None, "Not recording"
             
+            encoder = self.encoder
+            video_file = self.video_file
+            duration = time.time() - self.recording_start_time
+            filename = self.current_video_file
+            h264_path = self.h264_path
+            mp4_path = self.current_video_path
+            
+            self.is_recording = False
+            self.current_video_file = None
+            self.current_video_path = None
+            self.h264_path = None
+            self.encoder = None
+            self.output = None
+            self.video_file = None
+            self.recording_start_time = None
+            # Report the file as being finalized straight away
+            self._pending_remuxes[filename] = None
+            self._notify_recording_change()
+
+        try:
+            # Stop only the H.264 encoder; the MJPEG stream keeps running
+            self.picam2.stop_encoder(encoder)
+            # FileOutput doesn't close files it was handed: write out the tail
+            video_file.close()
+        except Exception as e:
+            self._remux_done(filename)
+            print(f"❌ Stop recording error: {e}")
+            import traceback
+            traceback.print_exc()
+            return None, str(e)
+
+        # Remux in the background: status and the next recording don't wait
+        future = self._remux_executor.submit(
+            self._remux_h264_to_mp4, h264_path, mp4_path, duration, filename)
+        with self.recording_lock:
+            self._pending_remuxes[filename] = future
+        future.add_done_callback(lambda f: self._remux_done(filename, f))
+        
+        return {
+            "filename": filename,
+            "duration": round(duration, 1),
+            "path": mp4_path,
+            "status": "finalizing",
+        }, None
+
+    def _remux_done(self, filename, future=None):
+        """Forget a finished remux and record its outcome"""
+        path = None
+        if future is not None:
             try:
-                # Stop encoder
-                self.picam2.stop_encoder()
-                
-                duration = time.time() - self.recording_start_time
-                filename = self.current_video_file
-                h264_path = self.h264_path
-                mp4_path = self.current_video_path
-                
-                self.is_recording = False
-                self.current_video_file = None
-                self.current_video_path = None
-                self.h264_path = None
-                self.encoder = None
-                self.output = None
-                self.recording_start_time = None
-                
-                # Give encoder a moment to finalize
-                time.sleep(0.3)
-                
-                # Convert H.264 to MP4 using FFmpeg
-                if os.path.exists(h264_path):
-                    print(f"📦 Converting to MP4...")
-                    try:
-                        # Use FFmpeg to wrap H.264 in MP4 container
-                        cmd = [
-                            'ffmpeg', '-y',
-                            '-framerate', str(config.VIDEO_FPS),
-                            '-i', h264_path,
-                            '-c', 'copy',  # No re-encoding, just wrap
-                            mp4_path
-                        ]
-                        result = subprocess.run(cmd, capture_output=True, text=True, timeout=60)
-                        
-                        if result.returncode == 0 and os.path.exists(mp4_path):
-                            # Remove temp h264 file
-                            os.remove(h264_path)
-                            file_size = os.path.getsize(mp4_path)
-                            print(f"⏹️ Recording stopped: {filename}")
-                            print(f"   Duration: {duration:.1f} seconds")
-                            print(f"   File size: {file_size / 1024 / 1024:.1f} MB")
-                        else:
-                            print(f"⚠️ FFmpeg conversion failed: {result.stderr}")
-                            # Keep h264 file as fallback
-                            mp4_path = h264_path
-                            filename = filename.replace('.mp4', '.h264')
-                            
-                    except subprocess.TimeoutExpired:
-                        print(f"⚠️ FFmpeg timeout, keeping raw h264")
-                        mp4_path = h264_path
-                        filename = filename.replace('.mp4', '.h264')
-                else:
-                    print(f"⚠️ Warning: H264 file not found at {h264_path}")
-                
-                return {
-                    "filename": filename,
-                    "duration": round(duration, 1),
-                    "path": mp4_path
-                }, None
-                
+                path = future.result()
             except Exception as e:
-                self.is_recording = False
-                print(f"❌ Stop recording error: {e}")
-                import traceback
-                traceback.print_exc()
-                return None, str(e)
+                print(f"❌ Remux error ({filename}): {e}")
+        with self.recording_lock:
+            self._pending_remuxes.pop(filename, None)
+            self._finished_remuxes.append({
+                "filename": filename,
+                "path": path,  # MP4, the kept .h264 on failure, or None
+                "mp4": path is not None and path.endswith('.mp4'),
+            })
+            self._notify_recording_change()
+
+    def _notify_recording_change(self):
+        """Wake /record/events streams (call with recording_lock held)"""
+        self._recording_version += 1
+        self.recording_changed.notify_all()
+
+    def _remux_h264_to_mp4(self, h264_path, mp4_path, duration, filename):
+        """Wrap the raw H.264 file in MP4 (worker thread); returns the final path"""
+        # No settle delay needed: stop_recording has already stopped the
+        # encoder and closed the file before this job is submitted
+        if not os.path.exists(h264_path):
+            print(f"⚠️ Warning: H264 file not found at {h264_path}")
+            return None
+
+        print(f"📦 Converting to MP4...")
+        ok = False
+        if av is not None:
+            try:
+                self._remux_with_av(h264_path, mp4_path)
+                ok = True
+            except Exception as e:
+                self._remove_partial(mp4_path)
+                print(f"⚠️ PyAV remux failed ({e}), trying ffmpeg")
+        if not ok:
+            ok = self._remux_with_ffmpeg(h264_path, mp4_path)
+            if not ok:
+                self._remove_partial(mp4_path)
+
+        if ok and os.path.exists(mp4_path):
+            # Remove temp h264 file
+            os.remove(h264_path)
+            file_size = os.path.getsize(mp4_path)
+            print(f"⏹️ Recording stopped: {filename}")
+            print(f"   Duration: {duration:.1f} seconds")
+            print(f"   File size: {file_size / 1024 / 1024:.1f} MB")
+            return mp4_path
+        # Keep h264 file as fallback
+        return h264_path
+
+    @staticmethod
+    def _remove_partial(path):
+        """Delete a truncated MP4 left by a failed remux"""
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def _remux_with_av(h264_path, mp4_path):
+        """Wrap raw H.264 in MP4 in-process with PyAV (no re-encode, no subprocess)"""
+        time_base = Fraction(1, config.VIDEO_FPS)
+        with av.open(h264_path, 'r', format='h264') as src, \
+                av.open(mp4_path, 'w', format='mp4',
+                        options={'movflags': '+faststart'}) as dst:
+            in_stream = src.streams.video[0]
+            if hasattr(dst, 'add_stream_from_template'):  # PyAV >= 14
+                out_stream = dst.add_stream_from_template(in_stream)
+            else:
+                out_stream = dst.add_stream(template=in_stream)
+            out_stream.time_base = time_base
+            index = 0
+            for packet in src.demux(in_stream):
+                if packet.size == 0:
+                    continue  # Demuxer flush packet
+                # Raw H.264 has no timestamps and the Pi encoder emits no
+                # B-frames, so decode order is presentation order
+                packet.pts = packet.dts = index
+                packet.duration = 1  # Demuxer's duration is in its own time base
+                packet.time_base = time_base
+                packet.stream = out_stream
+                dst.mux(packet)
+                index += 1
+
+    @staticmethod
+    def _remux_with_ffmpeg(h264_path, mp4_path):
+        """Wrap raw H.264 in MP4 with the ffmpeg CLI; returns True on success"""
+        try:
+            # Use FFmpeg to wrap H.264 in MP4 container
+            cmd = [
+                'ffmpeg', '-y',
+                '-loglevel', 'error',  # Keep the captured stderr small
+                # Raw H.264 has no timestamps: generate them at the recording rate
+                '-fflags', '+genpts',
+                '-r', str(config.VIDEO_FPS),
+                '-i', h264_path,
+                '-c:v', 'copy',  # No re-encoding, just wrap
+                '-movflags', '+faststart',  # moov atom first for instant web playback
+                mp4_path
+            ]
+            result = subprocess.run(cmd, capture_output=True, text=True, timeout=60)
+            if result.returncode == 0:
+                return True
+            print(f"⚠️ FFmpeg conversion failed: {result.stderr}")
+        except subprocess.TimeoutExpired:
+            print(f"⚠️ FFmpeg timeout, keeping raw h264")
+        except Exception as e:
+            print(f"⚠️ FFmpeg error: {e}, keeping raw h264")
+        return False
     
     def get_recording_status(self):
         """Get current recording status"""
         with self.recording_lock:
-            if self.is_recording:
-                duration = time.time() - self.recording_start_time
-                return {
-                    "recording": True,
-                    "filename": self.current_video_file,
-                    "duration": round(duration, 1),
-                    "resolution": f"{config.VIDEO_SIZE[0]}x{config.VIDEO_SIZE[1]}",
-                    "bitrate_mbps": config.VIDEO_BITRATE // 1000000,
-                }
-            return {"recording": False}
+            return self._recording_status()
+
+    def wait_recording_change(self, version, timeout):
+        """Wait until the recording state moves past version or timeout expires.
+
+        Returns (version, status); version=None returns the current state at once.
+        """
+        with self.recording_changed:
+            self.recording_changed.wait_for(
+                lambda: self._recording_version != version, timeout)
+            return self._recording_version, self._recording_status()
+
+    def _recording_status(self):
+        """Status dict (call with recording_lock held)"""
+        if self.is_recording:
+            duration = time.time() - self.recording_start_time
+            return {
+                "recording": True,
+                "filename": self.current_video_file,
+                "duration": round(duration, 1),
+                "resolution": f"{config.VIDEO_SIZE[0]}x{config.VIDEO_SIZE[1]}",
+                "bitrate_mbps": config.VIDEO_BITRATE // 1000000,
+                "remuxing": list(self._pending_remuxes),
+                "finished": list(self._finished_remuxes),
+            }
+        return {
+            "recording": False,
+            "remuxing": list(self._pending_remuxes),
+            "finished": list(self._finished_remuxes),
+        }
         
     def stop(self):
         """Stop camera and any active recording"""
         # Stop recording if active
         if self.is_recording:
             self.stop_recording()
+        # Let pending MP4 conversions finish before exiting
+        self._remux_executor.shutdown(wait=True)
             
         self.running = False
         if hasattr(self, 'capture_thread'):
             self.capture_thread.join(timeout=1.0)
+        with self.frame_lock:
+            req, self.frame_req = self.frame_req, None
+        if req is not None:
+            req.release()
         self.picam2.stop()
         self.picam2.close()
 
@@ -293,25 +594,38 @@ print(f"📁 Save folder: {config.SAVE_FOLDER}")
 
 def cleanup():
     camera.stop()
+    _log_listener.stop()  # Flush queued log records
 
 atexit.register(cleanup)
 
 # =============================================================================
 # VIDEO STREAMING
 # =============================================================================
+# Multipart part framing, built once; only the length changes per frame
+_MJPEG_HEADER = b'--frame\r\nContent-Type: image/jpeg\r\nContent-Length: '
+_MJPEG_SEP = b'\r\n\r\n'
+_MJPEG_TAIL = b'\r\n'
+
 def generate_frames():
     """Generate MJPEG stream for web browser"""
-    while True:
-        try:
-            jpeg_bytes = camera.get_frame_jpeg(quality=70)
-            if jpeg_bytes:
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + jpeg_bytes + b'\r\n')
-            else:
-                time.sleep(0.01)
-        except Exception as e:
-            print(f"Stream error: {e}")
-            continue
+    # Frames are encoded once by the MJPEG encoder and fanned out to every
+    # viewer's own bounded queue; wait for the next one instead of polling
+    queue = camera.jpeg_output.subscribe()
+    try:
+        while True:
+            try:
+                jpeg_bytes = camera.jpeg_output.get(queue, timeout=1.0)
+                if jpeg_bytes:
+                    # Yield the JPEG on its own rather than concatenating it
+                    # into the part: no per-frame copy of the whole image
+                    yield b'%s%d%s' % (_MJPEG_HEADER, len(jpeg_bytes), _MJPEG_SEP)
+                    yield jpeg_bytes
+                    yield _MJPEG_TAIL
+            except Exception as e:
+                log_throttled("stream", "Stream error: %s", e)
+                continue
+    finally:
+        camera.jpeg_output.unsubscribe(queue)  # Client disconnected
 
 # =============================================================================
 # API ROUTES
@@ -322,16 +636,14 @@ def save_picture():
     try:
         filename, error = camera.save_frame()
         if error:
-            return jsonify({"success": False, "error": error})
+            return ojson({"success": False, "error": error})
         print(f"📸 Saved: {filename}")
-        return jsonify({"success": True, "filename": filename})
+        return ojson({"success": True, "filename": filename})
     except Exception as e:
-        return jsonify({"success": False, "error": str(e)})
+        return ojson({"success": False, "error": str(e)})
 
-@app.route('/')
-def index():
-    """Web interface with live stream and video recording"""
-    return '''<!DOCTYPE html>
+# Web interface page: encoded and hashed once at import
+_INDEX_HTML = '''<!DOCTYPE html>
 <html><head><title>Camera Stream</title>
 <style>
 body{background:#1a1a1a;color:#fff;font-family:'Segoe UI',sans-serif;text-align:center;padding:20px;margin:0}
@@ -379,6 +691,7 @@ button.stop:hover{background:#ff8c5a}
 <div class="endpoint"><code>POST /record/start</code> - Start video recording</div>
 <div class="endpoint"><code>POST /record/stop</code> - Stop video recording</div>
 <div class="endpoint"><code>GET /record/status</code> - Recording status</div>
+<div class="endpoint"><code>GET /record/events</code> - Recording status stream (SSE)</div>
 <div class="endpoint"><code>GET /status</code> - Camera status</div>
 </div>
 </div>
@@ -386,6 +699,7 @@ button.stop:hover{background:#ff8c5a}
 let isRecording = false;
 let recordTimer = null;
 let recordStart = 0;
+let remuxing = [];
 
 function save(){
   fetch('/save_picture',{method:'POST'}).then(r=>r.json()).then(d=>{
@@ -406,15 +720,7 @@ function toggleRecord(){
 function startRecording(){
   fetch('/record/start',{method:'POST'}).then(r=>r.json()).then(d=>{
     if(d.success){
-      isRecording = true;
-      recordStart = Date.now();
-      document.getElementById('recordBtn').textContent = '⏹️ Stop (R)';
-      document.getElementById('recordBtn').classList.add('recording');
-      document.getElementById('recordBtn').classList.remove('record');
-      document.getElementById('recordBtn').classList.add('stop');
-      document.getElementById('recordStatus').classList.add('active');
-      document.getElementById('recFilename').textContent = d.filename;
-      recordTimer = setInterval(updateDuration, 1000);
+      showRecording(d.filename, 0);
       showMsg('🎬 Recording started: ' + d.filename, '#8f8');
     }else{
       showMsg('❌ ' + d.error, '#f88');
@@ -425,19 +731,37 @@ function startRecording(){
 function stopRecording(){
   fetch('/record/stop',{method:'POST'}).then(r=>r.json()).then(d=>{
     if(d.success){
-      isRecording = false;
-      clearInterval(recordTimer);
-      document.getElementById('recordBtn').textContent = '🎬 Record (R)';
-      document.getElementById('recordBtn').classList.remove('recording','stop');
-      document.getElementById('recordBtn').classList.add('record');
-      document.getElementById('recordStatus').classList.remove('active');
-      showMsg('✅ Video saved: ' + d.filename + ' (' + d.duration + 's)', '#8f8');
+      showStopped();
+      showMsg('⏳ Finalizing video: ' + d.filename + ' (' + d.duration + 's)', '#8f8');
     }else{
       showMsg('❌ ' + d.error, '#f88');
     }
   });
 }
 
+function showRecording(filename, duration){
+  recordStart = Date.now() - (duration * 1000);
+  document.getElementById('recFilename').textContent = filename;
+  updateDuration();
+  if(isRecording) return;
+  isRecording = true;
+  document.getElementById('recordBtn').textContent = '⏹️ Stop (R)';
+  document.getElementById('recordBtn').classList.add('recording','stop');
+  document.getElementById('recordBtn').classList.remove('record');
+  document.getElementById('recordStatus').classList.add('active');
+  recordTimer = setInterval(updateDuration, 1000);  // Local clock, no requests
+}
+
+function showStopped(){
+  if(!isRecording) return;
+  isRecording = false;
+  clearInterval(recordTimer);
+  document.getElementById('recordBtn').textContent = '🎬 Record (R)';
+  document.getElementById('recordBtn').classList.remove('recording','stop');
+  document.getElementById('recordBtn').classList.add('record');
+  document.getElementById('recordStatus').classList.remove('active');
+}
+
 function updateDuration(){
   let elapsed = Math.floor((Date.now() - recordStart) / 1000);
   let mins = String(Math.floor(elapsed / 60)).padStart(2, '0');
@@ -451,48 +775,72 @@ function showMsg(text, color){
   setTimeout(()=>msg.innerHTML='',5000);
 }
 
-// Check recording status on page load
-fetch('/record/status').then(r=>r.json()).then(d=>{
-  if(d.recording){
-    isRecording = true;
-    recordStart = Date.now() - (d.duration * 1000);
-    document.getElementById('recordBtn').textContent = '⏹️ Stop (R)';
-    document.getElementById('recordBtn').classList.add('recording','stop');
-    document.getElementById('recordBtn').classList.remove('record');
-    document.getElementById('recordStatus').classList.add('active');
-    document.getElementById('recFilename').textContent = d.filename;
-    recordTimer = setInterval(updateDuration, 1000);
-    updateDuration();
-  }
-});
+// Recording state is pushed by the server (initial state, changes, heartbeats)
+new EventSource('/record/events').onmessage = e=>{
+  let d = JSON.parse(e.data);
+  if(d.recording) showRecording(d.filename, d.duration);
+  else showStopped();
+  remuxing.filter(f=>!d.remuxing.includes(f)).forEach(f=>{
+    let r = d.finished.find(x=>x.filename == f);
+    if(r && r.mp4) showMsg('✅ Video saved: ' + f, '#8f8');
+    else if(r && r.path) showMsg('⚠️ MP4 conversion failed, raw video kept: ' + r.path, '#fc6');
+    else showMsg('❌ Video not saved: ' + f, '#f88');
+  });
+  remuxing = d.remuxing;
+};
 
 document.onkeydown=e=>{
   if(e.key.toLowerCase()=='s')save();
   if(e.key.toLowerCase()=='r')toggleRecord();
 };
 </script></body></html>'''
+_INDEX_HTML_BYTES = _INDEX_HTML.encode('utf-8')
+_INDEX_ETAG = hashlib.blake2b(_INDEX_HTML_BYTES, digest_size=16).hexdigest()
+
+@app.route('/')
+def index():
+    """Web interface with live stream and video recording"""
+    response = Response(_INDEX_HTML_BYTES, mimetype='text/html')
+    response.set_etag(_INDEX_ETAG)
+    response.headers['Cache-Control'] = 'public, max-age=60'
+    return response.make_conditional(request)  # 304 on a matching If-None-Match
+
+@app.before_request
+def _disable_nagle_for_stream():
+    """Send each MJPEG part immediately instead of waiting on Nagle's algorithm"""
+    if request.path != '/video_feed':
+        return
+    # gunicorn and the Werkzeug dev server both expose the client socket
+    sock = request.environ.get('gunicorn.socket') or request.environ.get('werkzeug.socket')
+    if sock is not None:
+        try:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except OSError:
+            pass
 
 @app.route('/video_feed')
 def video_feed():
     """MJPEG video stream"""
-    return Response(generate_frames(), mimetype='multipart/x-mixed-replace; boundary=frame')
+    response = Response(generate_frames(), mimetype='multipart/x-mixed-replace; boundary=frame')
+    response.headers['X-Accel-Buffering'] = 'no'  # Don't let nginx buffer the stream
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
 
 @app.route('/frame')
 def get_frame():
     """Get current frame as JPEG"""
     jpeg_bytes = camera.get_frame_jpeg()
     if jpeg_bytes is None:
-        return jsonify({"error": "No frame available"}), 503
+        return ojson({"error": "No frame available"}, 503)
     return Response(jpeg_bytes, mimetype='image/jpeg')
 
 @app.route('/status')
 def get_status():
     """Camera and server status"""
-    frame = camera.get_frame()
     recording_status = camera.get_recording_status()
-    return jsonify({
+    return ojson({
         "camera_running": camera.running,
-        "frame_available": frame is not None,
+        "frame_available": camera.frame_available,
         "resolution": config.SENSOR_SIZE,
         "video_resolution": config.VIDEO_SIZE,
         "video_bitrate_mbps": config.VIDEO_BITRATE // 1000000,
@@ -512,10 +860,10 @@ def start_recording():
     try:
         filename, error = camera.start_recording()
         if error:
-            return jsonify({"success": False, "error": error})
-        return jsonify({"success": True, "filename": filename})
+            return ojson({"success": False, "error": error})
+        return ojson({"success": True, "filename": filename})
     except Exception as e:
-        return jsonify({"success": False, "error": str(e)})
+        return ojson({"success": False, "error": str(e)})
 
 @app.route('/record/stop', methods=['POST'])
 def stop_recording():
@@ -523,20 +871,36 @@ def stop_recording():
     try:
         result, error = camera.stop_recording()
         if error:
-            return jsonify({"success": False, "error": error})
-        return jsonify({
+            return ojson({"success": False, "error": error})
+        return ojson({
             "success": True,
             "filename": result["filename"],
             "duration": result["duration"],
-            "path": result["path"]
+            "path": result["path"],
+            "status": result["status"],
         })
     except Exception as e:
-        return jsonify({"success": False, "error": str(e)})
+        return ojson({"success": False, "error": str(e)})
 
 @app.route('/record/status')
 def recording_status():
     """Get recording status"""
-    return jsonify(camera.get_recording_status())
+    return ojson(camera.get_recording_status())
+
+def _record_events():
+    """Server-Sent Events: status on connect, on every change, and as a heartbeat"""
+    version = None
+    while True:
+        version, status = camera.wait_recording_change(version, timeout=15.0)
+        yield b'data: ' + json_bytes(status) + b'\n\n'
+
+@app.route('/record/events')
+def recording_events():
+    """Push recording status changes instead of having clients poll"""
+    response = Response(_record_events(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
 # =============================================================================
 # MAIN
@@ -568,7 +932,11 @@ if __name__ == '__main__':
     print("   → POST /record/start   - Start recording")
     print("   → POST /record/stop    - Stop recording")
     print("   → GET  /record/status  - Recording status")
+    print("   → GET  /record/events  - Recording status stream (SSE)")
     print("   → GET  /status         - Camera status")
+    print("")
+    print("   🚀 Production: gunicorn -k gthread --threads 8 -w 1 -b 0.0.0.0:5000 live_cam_normal:app")
     print("=" * 60)
     
+    # Werkzeug development server; under gunicorn this block never runs
     app.run(host='0.0.0.0', port=5000, debug=False, threaded=True)
@@ -0,0 +1,17 @@
+"""
+YOLO preprocess kernel shared by live_cam.py (Numba JIT) and build_kernels.py (AOT)
+Stretch + normalize + HWC->CHW in one pass over the letterboxed frame.
+"""
+from numba import prange
+
+
+def preprocess_chw(frame_u8, lows, highs, mean, inv_std, out_chw):
+    """Write clip((x - low) / (high - low)) normalized by mean/std into out_chw[c, y, x]"""
+    h, w, _ = frame_u8.shape
+    inv_range = 1.0 / (highs - lows)
+    for y in prange(h):
+        for x in range(w):
+            for c in range(3):
+                v = (frame_u8[y, x, c] - lows[c]) * inv_range[c]
+                v = min(max(v, 0.0), 1.0)
+                out_chw[c, y, x] = (v - mean[c]) * inv_std[c]
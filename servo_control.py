@@ -1,7 +1,10 @@
 from __future__ import annotations
 
+import threading
+import time
 from dataclasses import dataclass
-from typing import Optional
+from functools import cached_property
+from typing import Callable, Iterable, Optional
 
 
 try:
@@ -10,6 +13,12 @@ except Exception:  # pragma: no cover
     pigpio = None
 
 
+SERVO_FRAME_US = 20000  # 50Hz servo frame
+WAVE_CHAIN_MAX = 600  # pigpio's limit on wave_chain() length, in bytes
+WAVE_CHAIN_LOOPS = 20  # pigpio's limit on loop counters per chain
+WAVE_BATCH_MAX = 100  # Waves sweep() holds at once (pigpio allows 250 per daemon)
+
+
 @dataclass(frozen=True)
 class ServoConfig:
     gpio: int
@@ -24,6 +33,30 @@ class ServoConfig:
     def clamp_angle(self, angle: float) -> float:
         return max(self.min_angle, min(self.max_angle, float(angle)))
 
+    @cached_property
+    def us_per_deg(self) -> float:
+        """Pulse width change per degree (computed once per config)."""
+        span_angle = self.max_angle - self.min_angle
+        if span_angle <= 0:
+            raise ValueError("Invalid angle range")
+        return (self.max_us - self.min_us) / span_angle
+
+    def pulse_mapper(self):
+        """Return angle -> (clamped angle, pulse_us) with the limits baked in."""
+        min_us = self.min_us
+        min_angle, max_angle = self.min_angle, self.max_angle
+        us_per_deg = self.us_per_deg
+
+        def pulse_for(angle: float) -> tuple[float, int]:
+            # A clamped angle can't map outside min_us..max_us, so the pulse
+            # needs no second clamp
+            angle = float(angle)
+            angle = angle if angle > min_angle else min_angle
+            angle = angle if angle < max_angle else max_angle
+            return angle, int(min_us + (angle - min_angle) * us_per_deg)
+
+        return pulse_for
+
 
 class MG90SServo:
     """Simple MG90S servo control for Raspberry Pi.
@@ -38,6 +71,7 @@ class MG90SServo:
 
     def __init__(self, config: ServoConfig, *, pi: Optional["pigpio.pi"] = None):
         self.config = config
+        self._pulse_us: Optional[int] = None  # Last pulse width sent; None = unknown/off
         self._pi = pi
         self._owns_pi = False
 
@@ -56,6 +90,12 @@ class MG90SServo:
                 "Cannot connect to pigpio daemon. Start it with: sudo systemctl enable --now pigpiod"
             )
 
+    @cached_property
+    def _pulse_for(self) -> Callable[[float], tuple[float, int]]:
+        # Built on first move, so an invalid angle range still fails in
+        # set_angle/sweep rather than in the constructor
+        return self.config.pulse_mapper()
+
     def close(self) -> None:
         try:
             self.off()
@@ -75,6 +115,7 @@ class MG90SServo:
         if self._pi is None:
             return
         self._pi.set_servo_pulsewidth(self.config.gpio, 0)  # type: ignore[union-attr]
+        self._pulse_us = None
 
     def set_pulse_us(self, pulse_us: int) -> int:
         """Set raw pulse width in microseconds. Returns the clamped value."""
@@ -82,6 +123,7 @@ class MG90SServo:
             raise RuntimeError("Servo is closed")
         clamped = self.config.clamp_pulse_us(pulse_us)
         self._pi.set_servo_pulsewidth(self.config.gpio, clamped)  # type: ignore[union-attr]
+        self._pulse_us = clamped
         return clamped
 
     def set_angle(self, angle: float) -> float:
@@ -89,13 +131,107 @@ class MG90SServo:
         if self._pi is None:
             raise RuntimeError("Servo is closed")
 
-        angle = self.config.clamp_angle(angle)
+        angle, pulse = self._pulse_for(angle)
+        if pulse != self._pulse_us:  # Already there: skip the daemon round trip
+            self._pi.set_servo_pulsewidth(self.config.gpio, pulse)  # type: ignore[union-attr]
+            self._pulse_us = pulse
+        return angle
 
-        span_angle = self.config.max_angle - self.config.min_angle
-        if span_angle <= 0:
-            raise ValueError("Invalid angle range")
+    def sweep(
+        self,
+        angles: Iterable[float],
+        step_ms: float,
+        on_step: Optional[Callable[[float], None]] = None,
+        stop: Optional[threading.Event] = None,
+    ) -> None:
+        """Move through angles, holding each for step_ms, as pigpio wave chains.
+
+        One single-frame wave is created per distinct pulse width and the
+        daemon repeats it with wave_chain loop opcodes, so pulse timing comes
+        from the DMA engine instead of Python sleeps. Sweeps with more than
+        WAVE_BATCH_MAX distinct pulses are sent in batches, each with its own
+        waves; only waves created here are deleted. Blocks until the chains
+        have been sent, then holds the last angle. If given, on_step(angle) is
+        called (from the wait loop, by elapsed time) as each step starts; it
+        only reports progress and doesn't affect the pulses. Setting stop
+        (from another thread) halts the sweep and leaves the servo off.
+        """
+        if self._pi is None:
+            raise RuntimeError("Servo is closed")
 
-        t = (angle - self.config.min_angle) / span_angle
-        pulse = int(self.config.min_us + t * (self.config.max_us - self.config.min_us))
-        self.set_pulse_us(pulse)
-        return angle
+        cfg = self.config
+        pulse_for = self._pulse_for
+        frames = max(1, round(step_ms * 1000 / SERVO_FRAME_US))
+        mask = 1 << cfg.gpio
+
+        steps = []
+        batches = [[]]  # Runs of [pulse_us, frames], consecutive repeats merged
+        batch_pulses = set()
+        for angle in angles:
+            angle, pulse_us = pulse_for(angle)
+            steps.append(angle)
+            runs = batches[-1]
+            if runs and runs[-1][0] == pulse_us:
+                runs[-1][1] += frames
+                continue
+            if pulse_us not in batch_pulses and len(batch_pulses) == WAVE_BATCH_MAX:
+                batches.append([])
+                batch_pulses = set()
+            batches[-1].append([pulse_us, frames])
+            batch_pulses.add(pulse_us)
+        if not steps:
+            return
+
+        pi = self._pi
+        pi.set_servo_pulsewidth(cfg.gpio, 0)  # Servo PWM and waves can't share the pin
+        self._pulse_us = None
+        pi.set_mode(cfg.gpio, pigpio.OUTPUT)
+
+        step_s = frames * SERVO_FRAME_US / 1e6
+        reported = -1
+        t0 = time.monotonic()
+        for runs in batches:
+            wids = {}
+            try:
+                # Chains split on pigpio's byte and loop-counter limits
+                chains = [[]]
+                loops = 0
+                for pulse_us, count in runs:
+                    if pulse_us not in wids:
+                        pi.wave_add_new()  # Start from an empty pulse list
+                        pi.wave_add_generic([pigpio.pulse(mask, 0, pulse_us),
+                                             pigpio.pulse(0, mask, SERVO_FRAME_US - pulse_us)])
+                        wids[pulse_us] = pi.wave_create()
+                    wid = wids[pulse_us]
+                    while count:
+                        n = min(count, 0xFFFF)
+                        # Loop opcodes: 255 0 = loop start, 255 1 x y = repeat x + 256*y times
+                        entry = [wid] if n == 1 else [255, 0, wid, 255, 1, n & 0xFF, n >> 8]
+                        if (len(chains[-1]) + len(entry) > WAVE_CHAIN_MAX
+                                or (n > 1 and loops == WAVE_CHAIN_LOOPS)):
+                            chains.append([])
+                            loops = 0
+                        chains[-1].extend(entry)
+                        loops += n > 1
+                        count -= n
+
+                for chain in chains:
+                    pi.wave_chain(chain)
+                    while pi.wave_tx_busy():
+                        if stop is not None and stop.is_set():
+                            return  # finally stops the chain; servo stays off
+                        if on_step is not None:
+                            i = min(int((time.monotonic() - t0) / step_s), len(steps) - 1)
+                            if i != reported:
+                                reported = i
+                                on_step(steps[i])
+                        time.sleep(SERVO_FRAME_US / 1e6)
+            finally:
+                # On an early exit (stop, Ctrl-C, on_step error) the chain is
+                # still running from DMA: stop it before its waves are deleted
+                pi.wave_tx_stop()
+                for wid in wids.values():
+                    pi.wave_delete(wid)
+        if on_step is not None and reported != len(steps) - 1:
+            on_step(steps[-1])
+        self.set_angle(steps[-1])
@@ -26,10 +26,9 @@ def main() -> int:
             return 0
 
         if args.sweep:
-            for a in (0, 45, 90, 135, 180, 135, 90, 45, 0):
-                servo.set_angle(a)
-                print(f"Angle: {a}")
-                time.sleep(args.delay)
+            angles = (0, 45, 90, 135, 180, 135, 90, 45, 0)
+            print(f"Sweeping: {' -> '.join(map(str, angles))}")
+            servo.sweep(angles, args.delay * 1000)
             return 0
 
         # Default: center servo
@@ -9,7 +9,7 @@ Run this to diagnose color issues (RGB vs BGR, etc.)
 """
 
 from picamera2 import Picamera2
-from PIL import Image
+import cv2
 import numpy as np
 import os
 import time
@@ -17,6 +17,7 @@ import time
 # Create test output folder
 TEST_FOLDER = "/home/ali/color_test"
 os.makedirs(TEST_FOLDER, exist_ok=True)
+JPEG_PARAMS = [cv2.IMWRITE_JPEG_QUALITY, 90]
 
 print("=" * 60)
 print("🎨 Camera Color Configuration Test")
@@ -57,24 +58,23 @@ for fmt in FORMATS_TO_TEST:
         
         picam2.stop()
         
-        # Save as-is (no conversion)
-        img_raw = Image.fromarray(frame)
-        img_raw.save(f"{TEST_FOLDER}/{fmt}_raw.jpg")
+        # Save as-is (no conversion), i.e. channels read as R, G, B(, X)
+        # cv2.imwrite expects BGR, so an RGB reading needs one cvtColor pass
+        raw_code = cv2.COLOR_RGBA2BGR if frame.shape[2] == 4 else cv2.COLOR_RGB2BGR
+        cv2.imwrite(f"{TEST_FOLDER}/{fmt}_raw.jpg", cv2.cvtColor(frame, raw_code), JPEG_PARAMS)
         
         # If format has 4 channels (XRGB/XBGR), handle it
         if frame.shape[2] == 4:
-            # Remove alpha channel
-            frame = frame[:, :, :3]
+            # Remove alpha channel (one pass, contiguous result)
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR)
         
         # Save with different interpretations
         # As RGB (direct)
-        img_rgb = Image.fromarray(frame, mode='RGB')
-        img_rgb.save(f"{TEST_FOLDER}/{fmt}_as_RGB.jpg")
+        cv2.imwrite(f"{TEST_FOLDER}/{fmt}_as_RGB.jpg",
+                    cv2.cvtColor(frame, cv2.COLOR_RGB2BGR), JPEG_PARAMS)
         
-        # As BGR (swapped)
-        frame_swapped = frame[:, :, ::-1]  # Reverse channel order
-        img_bgr = Image.fromarray(frame_swapped, mode='RGB')
-        img_bgr.save(f"{TEST_FOLDER}/{fmt}_swapped.jpg")
+        # As BGR (swapped): that is cv2's native order, so no reversal needed
+        cv2.imwrite(f"{TEST_FOLDER}/{fmt}_swapped.jpg", frame, JPEG_PARAMS)
         
         print(f"  ✅ Saved: {fmt}_raw.jpg, {fmt}_as_RGB.jpg, {fmt}_swapped.jpg")
         print(f"     Shape: {frame.shape}, dtype: {frame.dtype}")
@@ -13,71 +13,122 @@ Before running:
   1. sudo apt install pigpio python3-pigpio
   2. sudo systemctl enable --now pigpiod
   3. python3 test_servo.py
+
+Optional, for less timing jitter: the script pins itself to CONTROL_CORE
+and asks for SCHED_FIFO (needs root or CAP_SYS_NICE). Adding
+  isolcpus=2 nohz_full=2 rcu_nocbs=2
+to /boot/firmware/cmdline.txt keeps other tasks and timer ticks off that core.
 """
 
+import asyncio
+import os
+import re
 import time
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from servo_control import SERVO_FRAME_US, MG90SServo, ServoConfig
 
 # ============================================================================
 # CONFIGURATION - Change GPIO if you used a different pin
 # ============================================================================
 SERVO_GPIO = 18  # BCM GPIO number (GPIO18 = physical pin 12)
+IDLE_OFF_S = None  # Interactive mode: seconds idle before relaxing the servo (None = hold)
+CONTROL_CORE = 2  # CPU core the test runs on (see isolcpus note above)
+RT_PRIORITY = 50  # SCHED_FIFO priority; None keeps the default scheduler
+SLEW_S_PER_DEG = 0.12 / 60  # MG90S travel time (~0.1 s/60° at 5V, with margin)
+SETTLE_MARGIN_S = 0.15  # Basic movement: extra dwell so each position is visible
+TEMP_WARN_C = 80.0  # Warn when the Pi's CPU gets this hot (throttling starts ~80°C)
 
 # ============================================================================
 
-try:
-    from servo_control import MG90SServo, ServoConfig
-except ImportError:
-    print("ERROR: servo_control.py not found in the same directory")
-    sys.exit(1)
+_BAR = "=" * 50  # Banner rule
+
+# Interactive angle input; out-of-range values are clamped by set_angle
+ANGLE_RE = re.compile(r"[-+]?([0-9]+(\.[0-9]*)?|\.[0-9]+)")
+
+
+# Basic movement: (message, angle) per step
+BASIC_STEPS = [
+    ("  Moving to CENTER (90°)... ", 90),
+    ("  Moving to MIN (0°)... ", 0),
+    ("  Moving to CENTER (90°)... ", 90),
+    ("  Moving to MAX (180°)... ", 180),
+    ("  Moving to CENTER (90°)... ", 90),
+]
 
+# Interactive 's' command
+QUICK_SWEEP_STEPS = [(None, 0), (None, 90), (None, 180), (None, 90)]
 
-def test_basic_movement(servo: MG90SServo):
+
+async def move_through(servo: MG90SServo, steps, min_dwell: float, margin: float = 0.0):
+    """Move to each (message, angle) in turn, dwelling for the travel time.
+
+    Dwells are scheduled against absolute deadlines so RPC latency and late
+    wakeups don't add up. The start position is unknown, so the first move
+    assumes full travel. A message (if not None) is printed before its move.
+    """
+    set_angle = servo.set_angle
+    write, flush = sys.stdout.write, sys.stdout.flush
+    prev = None
+    deadline = time.monotonic()
+    for msg, angle in steps:
+        if msg is not None:
+            write(msg)
+            flush()
+        set_angle(angle)
+        if msg is not None:
+            write("✓\n")
+        travel = 180 if prev is None else abs(angle - prev)
+        deadline += max(min_dwell, travel * SLEW_S_PER_DEG + margin)
+        prev = angle
+        dt = deadline - time.monotonic()
+        if dt > 0:
+            await asyncio.sleep(dt)
+
+
+async def test_basic_movement(servo: MG90SServo):
     """Test basic servo movement to key positions."""
-    print("\n" + "=" * 50)
-    print("TEST 1: Basic Movement")
-    print("=" * 50)
-    
-    positions = [
-        (90, "CENTER (90°)"),
-        (0, "MIN (0°)"),
-        (90, "CENTER (90°)"),
-        (180, "MAX (180°)"),
-        (90, "CENTER (90°)"),
-    ]
-    
-    for angle, description in positions:
-        print(f"  Moving to {description}...", end=" ", flush=True)
-        servo.set_angle(angle)
-        print("✓")
-        time.sleep(1)
-    
+    await move_through(servo, BASIC_STEPS, min_dwell=0.25, margin=SETTLE_MARGIN_S)
     print("  Basic movement test PASSED!")
 
 
-def test_sweep(servo: MG90SServo):
+async def test_sweep(servo: MG90SServo):
     """Test smooth sweep from 0 to 180 and back."""
-    print("\n" + "=" * 50)
-    print("TEST 2: Sweep Test (0° → 180° → 0°)")
-    print("=" * 50)
     
-    # Sweep forward
-    print("  Sweeping 0° to 180°...")
-    for angle in range(0, 181, 10):
-        servo.set_angle(angle)
-        print(f"    {angle}°", end="\r", flush=True)
-        time.sleep(0.1)
-    print("    180° ✓")
+    # Cosine-eased ramp sampled once per 20 ms servo frame: 1.9 s each way,
+    # 0.5 s hold at 180°. The whole ramp runs as one pigpio wave chain
+    up = 90.0 - 90.0 * np.cos(np.pi * np.linspace(0.0, 1.0, 95))
+    angles = up.tolist() + [180.0] * 25 + up[::-1].tolist()
+    print("  Sweeping 0° → 180° → 0°...")
     
-    time.sleep(0.5)
+    # Progress: rewrite one line in place (\x1b[K clears its tail), written
+    # straight to fd 1 - no text layer, buffering or stdout lock per step
+    write = os.write
+    shown = None
+    def show(angle):
+        nonlocal shown
+        if round(angle) != shown:  # Ease-in/out frames repeat the same degree
+            shown = round(angle)
+            write(1, b"\r\x1b[K    %3d\xc2\xb0" % shown)
     
-    # Sweep backward
-    print("  Sweeping 180° to 0°...")
-    for angle in range(180, -1, -10):
-        servo.set_angle(angle)
-        print(f"    {angle}° ", end="\r", flush=True)
-        time.sleep(0.1)
-    print("    0° ✓")
+    sys.stdout.flush()  # Earlier print() output must land before the raw writes
+    # sweep() blocks until the chain is sent: keep it off the event loop.
+    # The worker thread can't be interrupted, so on Ctrl-C/cancellation it is
+    # told to stop (which halts the DMA chain) and then waited for
+    stop = threading.Event()
+    worker = asyncio.ensure_future(
+        asyncio.to_thread(servo.sweep, angles, SERVO_FRAME_US / 1000, show, stop))
+    try:
+        await asyncio.shield(worker)
+    except asyncio.CancelledError:
+        stop.set()
+        await worker
+        raise
+    write(1, b" \xe2\x9c\x93\n")  # " ✓"
     
     # Return to center
     servo.set_angle(90)
@@ -85,47 +136,165 @@ def test_sweep(servo: MG90SServo):
     print("  Sweep test PASSED!")
 
 
-def test_interactive(servo: MG90SServo):
+async def test_interactive(servo: MG90SServo):
     """Interactive mode - type angles to move servo."""
-    print("\n" + "=" * 50)
-    print("TEST 3: Interactive Mode")
-    print("=" * 50)
     print("  Type an angle (0-180) and press Enter to move.")
     print("  Type 'q' to quit, 'c' for center, 's' for sweep.")
     print()
     
-    while True:
-        try:
-            user_input = input("  Angle> ").strip().lower()
+    # stdin is watched by the event loop instead of blocking in input(),
+    # so idle housekeeping and background tasks run between commands
+    loop = asyncio.get_running_loop()
+    fd = sys.stdin.fileno()
+    chunks: asyncio.Queue[bytes] = asyncio.Queue()
+    feeder = None
+    try:
+        loop.add_reader(fd, lambda: chunks.put_nowait(os.read(fd, 1024)))
+    except PermissionError:
+        # epoll can't watch regular files (python test_servo.py < cmds.txt):
+        # read them in a worker thread instead
+        async def feed():
+            while True:
+                chunk = await asyncio.to_thread(os.read, fd, 1024)
+                chunks.put_nowait(chunk)
+                if not chunk:
+                    return
+        feeder = asyncio.create_task(feed())
+    pending = b""
+    relaxed = False
+    print("  Angle> ", end="", flush=True)
+    try:
+        while True:
+            try:
+                chunk = await asyncio.wait_for(chunks.get(), None if relaxed else IDLE_OFF_S)  # None waits forever
+            except asyncio.TimeoutError:
+                servo.off()
+                relaxed = True
+                print("\n  (idle - servo relaxed)\n  Angle> ", end="", flush=True)
+                continue
             
-            if user_input == 'q':
-                print("  Exiting interactive mode.")
+            if not chunk:  # EOF (Ctrl-D / end of file)
+                if pending.strip():  # Last line had no newline
+                    print()
+                    if not await handle_command(servo, pending.decode(errors="replace")):
+                        return
+                print("\n  Exiting interactive mode.")
                 break
-            elif user_input == 'c':
-                servo.set_angle(90)
-                print("  → Moved to center (90°)")
-            elif user_input == 's':
-                print("  → Quick sweep...", end=" ", flush=True)
-                for a in [0, 90, 180, 90]:
-                    servo.set_angle(a)
-                    time.sleep(0.4)
-                print("Done!")
-            else:
-                try:
-                    angle = float(user_input)
-                    actual = servo.set_angle(angle)
-                    print(f"  → Moved to {actual:.1f}°")
-                except ValueError:
-                    print("  Invalid input. Enter a number 0-180, 'c', 's', or 'q'.")
-        except KeyboardInterrupt:
-            print("\n  Interrupted.")
-            break
+            pending += chunk
+            relaxed = False
+            
+            # Dispatch every complete line (several may arrive in one read)
+            while b"\n" in pending:
+                line, pending = pending.split(b"\n", 1)
+                if not await handle_command(servo, line.decode(errors="replace")):
+                    return
+                print("  Angle> ", end="", flush=True)
+    finally:
+        if feeder is None:
+            loop.remove_reader(fd)
+        else:
+            feeder.cancel()
+
+
+async def handle_command(servo: MG90SServo, user_input: str) -> bool:
+    """Run one interactive command. Returns False to leave interactive mode."""
+    user_input = user_input.strip().lower()
+    
+    if user_input == 'q':
+        print("  Exiting interactive mode.")
+        return False
+    elif user_input == 'c':
+        servo.set_angle(90)
+        print("  → Moved to center (90°)")
+    elif user_input == 's':
+        print("  → Quick sweep...", end=" ", flush=True)
+        await move_through(servo, QUICK_SWEEP_STEPS, min_dwell=0.05)
+        print("Done!")
+    elif ANGLE_RE.fullmatch(user_input):
+        actual = servo.set_angle(float(user_input))
+        print(f"  → Moved to {actual:.1f}°")
+    else:
+        print("  Invalid input. Enter a number 0-180, 'c', 's', or 'q'.")
+    return True
+
+
+_ALL_CPUS = os.sched_getaffinity(0)  # Mask before pin_process narrows it
+
+
+def pin_process():
+    """Pin the calling (event loop) thread to CONTROL_CORE at SCHED_FIFO (best effort).
+
+    Both settings only apply to this thread, but threads it creates later
+    inherit them: worker threads go through unpin_thread (see run_tests).
+    """
+    try:
+        if CONTROL_CORE in os.sched_getaffinity(0):
+            os.sched_setaffinity(0, {CONTROL_CORE})
+    except OSError as e:
+        print(f"Affinity warning: {e}")
+    if RT_PRIORITY is None:
+        return
+    try:
+        os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(RT_PRIORITY))
+    except PermissionError:
+        print("SCHED_FIFO needs root or CAP_SYS_NICE; keeping default priority")
+    except OSError as e:
+        print(f"Scheduler warning: {e}")
+
+
+def unpin_thread():
+    """Put a worker thread back on all cores at SCHED_OTHER (executor initializer)."""
+    try:
+        os.sched_setaffinity(0, _ALL_CPUS)
+        os.sched_setscheduler(0, os.SCHED_OTHER, os.sched_param(0))
+    except OSError:
+        pass  # Lowering priority needs no privileges; nothing else to do
+
+
+async def watch_health(interval: float = 1.0):
+    """Background check: warn once each time the CPU crosses TEMP_WARN_C."""
+    hot = False
+    while True:
+        try:
+            with open("/sys/class/thermal/thermal_zone0/temp") as f:
+                temp_c = int(f.read()) / 1000
+        except (OSError, ValueError):
+            return  # No thermal sensor (not a Pi): nothing to watch
+        if temp_c >= TEMP_WARN_C and not hot:
+            print(f"\n  WARNING: CPU at {temp_c:.1f}°C - throttling may disturb timing")
+        hot = temp_c >= TEMP_WARN_C
+        await asyncio.sleep(interval)
+
+
+# (header, test) in run order
+TESTS = [
+    ("TEST 1: Basic Movement", test_basic_movement),
+    ("TEST 2: Sweep Test (0° → 180° → 0°)", test_sweep),
+    ("TEST 3: Interactive Mode", test_interactive),
+]
+
+
+async def run_tests(servo: MG90SServo):
+    """Run TESTS in order with the health check alongside."""
+    # to_thread workers (sweep, stdin feeder) must not inherit the loop
+    # thread's SCHED_FIFO and core: they'd compete with the timing loop
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(initializer=unpin_thread))
+    health = asyncio.create_task(watch_health())
+    try:
+        for header, test in TESTS:
+            print("\n" + _BAR)
+            print(header)
+            print(_BAR)
+            await test(servo)
+    finally:
+        health.cancel()
 
 
 def main():
-    print("=" * 50)
+    print(_BAR)
     print("  SERVO TEST - GPIO{} (pin 12)".format(SERVO_GPIO))
-    print("=" * 50)
+    print(_BAR)
     
     # Create servo configuration
     config = ServoConfig(
@@ -148,11 +317,11 @@ def main():
         print("  3. Check status:   sudo systemctl status pigpiod")
         return 1
     
+    # After connecting, so pigpio's own callback thread isn't raised too
+    pin_process()
     try:
         # Run tests
-        test_basic_movement(servo)
-        test_sweep(servo)
-        test_interactive(servo)
+        asyncio.run(run_tests(servo))
         
         # Cleanup
         print("\nTest complete! Turning servo off...")